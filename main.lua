@@ -13,6 +13,7 @@ dofile("src/PhysicalEntity.lua")
 dofile("src/DynamicEntity.lua")
 dofile("src/Effect.lua")
 dofile("src/ObstaclePath.lua")
+dofile("src/LevelFile.lua")
 dofile("src/LightMap.lua")
 dofile("src/Level.lua")
 dofile("src/Game.lua")
@@ -102,6 +102,25 @@ end
 -------------------------------------------------------------------------------
 Level = {}
 
+-- Returns the scale and offsets from a definition's coordinates to world
+-- coordinates. Definitions converted with `svg_to_level.py --schema=game` are
+-- baked into world coordinates already.
+local function definitionTransform(def)
+  if def.baked then return 1, 0, 0 end
+  return Game.kScreenWidth / def.width,
+         -Game.kScreenWidth / 2, -Game.kScreenHeight / 2
+end
+
+-- Moves the vertices of a quad from a definition into world coordinates.
+local function quadToWorld(def, v)
+  if def.baked then return end
+  local scale, offsetX, offsetY = definitionTransform(def)
+  for i = 1,4 do
+    v[i].x = scale * v[i].x + offsetX
+    v[i].y = scale * v[i].y + offsetY
+  end
+end
+
 function Level.new(world, bgLayer, fgLayer, overlayLayer, assets)
   local self = setmetatable({}, { __index = Level })
   
@@ -200,12 +219,20 @@ end
 
 function Level:loadDefinition(index)
   if not index then index = self.defIndex_
-  else self.defIndex_ = index end
+  else
+    if index ~= self.defIndex_ then self.def_ = nil end
+    self.defIndex_ = index
+  end
+
+  -- Baked definitions are never modified, so restarts reuse them.
+  if self.def_ then return self.def_ end
 
-  local loader, err = loadfile(settings.levels[self.defIndex_].definition_path)
+  local loader, err = loadLevelFile(
+      settings.levels[self.defIndex_].definition_path)
   if loader == nil then print('Cannot open level ' .. err)
   else def = loader() end
 
+  if def and def.baked then self.def_ = def end
   return def
 end
 
@@ -227,8 +254,7 @@ function Level:restart()
 end
 
 function Level:createTransients_(def)
-  local scale = Game.kScreenWidth / def.width
-  local offsetX, offsetY = -Game.kScreenWidth / 2, -Game.kScreenHeight / 2
+  local scale, offsetX, offsetY = definitionTransform(def)
   self.player = Swimmer.new(self.transientCell_, self.assets)
   self.player.body:setTransform(def.Player.x * scale + offsetX,
                                 def.Player.y * scale + offsetY)
@@ -254,16 +280,18 @@ function Level:loadByIndex(newIndex)
   self.outDeck_:setTexture(settings.levels[newIndex].outline)
 
   local def = self:loadDefinition(newIndex)
-  local scale = Game.kScreenWidth / def.width
-  local offsetX = -Game.kScreenWidth / 2
-  local offsetY = -Game.kScreenHeight / 2
+  local scale, offsetX, offsetY = definitionTransform(def)
 
   self:createTransients_(def)
   self.goal = Goal.new(self.globalCell, settings.entities.goal,
                        def.Goal.x * scale + offsetX,
                        def.Goal.y * scale + offsetY)
 
-  ObstaclePath.new(self.globalCell, def.Collisions, scale, offsetX, offsetY)
+  if def.baked then
+    ObstaclePath.new(self.globalCell, def.Collisions)
+  else
+    ObstaclePath.new(self.globalCell, def.Collisions, scale, offsetX, offsetY)
+  end
 
   local image_to_entity = {}
   image_to_entity["spikycoral.png"] = "coral_killer"
@@ -287,10 +315,7 @@ function Level:loadByIndex(newIndex)
     if entity_name then
       local deck = killer_decks[entity_name]
       local entity = settings.entities[entity_name]
-      for i = 1,4 do
-        v[i].x = scale * v[i].x + offsetX
-        v[i].y = scale * v[i].y + offsetY
-      end
+      quadToWorld(def, v)
       Killer.new(self.globalCell, entity, deck, k, v, killerCallback)
     end
   end
@@ -303,10 +328,7 @@ function Level:loadByIndex(newIndex)
   for k, v in pairs(def.Algae) do
       local opts
 
-      for i = 1,4 do
-        v[i].x = scale * v[i].x + offsetX
-        v[i].y = scale * v[i].y + offsetY
-      end
+      quadToWorld(def, v)
 
       if v.link == "glowalgae_red_on.png" then
         opts = settings.entities.red_algae_glower
@@ -320,10 +342,7 @@ function Level:loadByIndex(newIndex)
   end
 
   for k, v in pairs(def.LitAlgae) do
-      for i = 1,4 do
-        v[i].x = scale * v[i].x + offsetX
-        v[i].y = scale * v[i].y + offsetY
-      end
+      quadToWorld(def, v)
 
       Glower.new(self.globalCell, settings.entities.green_algae_glower,
                  algaeDeck, (k + n - 1) * Glower.kIndicesRequired + 1, v)
@@ -334,10 +353,7 @@ function Level:loadByIndex(newIndex)
   cosmeticsDeck:reserve(#def.Cosmetics)
   cosmeticsDeck:setTexture(self.assets.cosmetics)
   for k, v in pairs(def.Cosmetics) do
-      for i = 1,4 do
-        v[i].x = scale * v[i].x + offsetX
-        v[i].y = scale * v[i].y + offsetY
-      end
+      quadToWorld(def, v)
 
       local prop = createPropFromVerts(cosmeticsDeck, k, v)
       cosmeticsDeck:setUVRect(
@@ -352,17 +368,10 @@ end
 function Level:addText(def)
   if not def.Text then return end
 
-  local scale = Game.kScreenWidth / def.width
-  local offsetX = -Game.kScreenWidth / 2
-  local offsetY = -Game.kScreenHeight / 2
-
   self.textProps_ = {}
 
   for k, v in pairs(def.Text) do
-    for i = 1,4 do
-      v[i].x = scale * v[i].x + offsetX
-      v[i].y = scale * v[i].y + offsetY
-    end
+    quadToWorld(def, v)
 
     local deck = MOAIGfxQuad2D.new()
     local prop = createPropFromVerts(deck, nil, v)
@@ -0,0 +1,178 @@
+--------------------------------------------------------------------------------
+-- Level file loading. Levels are either Lua scripts returning the definition
+-- table, or in the packed binary format written by
+-- `svg_to_level.py --format=binary` (see tools/svg_to_level/level_binary.py).
+--------------------------------------------------------------------------------
+local kBinaryMagic = 'LVLB'
+local kBinaryVersion = 2
+
+local function decodeUInt32(data, pos)
+  local b1, b2, b3, b4 = data:byte(pos, pos + 3)
+  return ((b4 * 256 + b3) * 256 + b2) * 256 + b1
+end
+
+local function decodeInt32(data, pos)
+  local n = decodeUInt32(data, pos)
+  if n >= 2147483648 then n = n - 4294967296 end
+  return n
+end
+
+local function decodeFloat32(data, pos)
+  local b1, b2, b3, b4 = data:byte(pos, pos + 3)
+  local sign = b4 >= 128 and -1 or 1
+  local exponent = (b4 % 128) * 2 + math.floor(b3 / 128)
+  local mantissa = ((b3 % 128) * 256 + b2) * 256 + b1
+  if exponent == 0 then
+    return sign * math.ldexp(mantissa, -149)
+  elseif exponent == 255 then
+    if mantissa == 0 then return sign * math.huge end
+    return 0 / 0
+  end
+  return sign * math.ldexp(mantissa + 8388608, exponent - 150)
+end
+
+local function decodeFloat64(data, pos)
+  local low = decodeUInt32(data, pos)
+  local b5, b6, b7, b8 = data:byte(pos + 4, pos + 7)
+  local sign = b8 >= 128 and -1 or 1
+  local exponent = (b8 % 128) * 16 + math.floor(b7 / 16)
+  local mantissa = (((b7 % 16) * 256 + b6) * 256 + b5) * 4294967296 + low
+  if exponent == 0 then
+    return sign * math.ldexp(mantissa, -1074)
+  elseif exponent == 2047 then
+    if mantissa == 0 then return sign * math.huge end
+    return 0 / 0
+  end
+  return sign * math.ldexp(mantissa + 4503599627370496, exponent - 1075)
+end
+
+local function decodeString(data, pos)
+  local length = decodeUInt32(data, pos)
+  return data:sub(pos + 4, pos + 3 + length), pos + 4 + length
+end
+
+local decodeValue
+
+local function decodeArray(data, pos, decodeElement)
+  local count = decodeUInt32(data, pos)
+  local array = {}
+  pos = pos + 4
+  for i = 1, count do
+    array[i] = decodeElement(data, pos)
+    pos = pos + 4
+  end
+  return array, pos
+end
+
+decodeValue = function(data, pos)
+  local tag = data:sub(pos, pos)
+  pos = pos + 1
+  if tag == 'T' then return true, pos
+  elseif tag == 'F' then return false, pos
+  elseif tag == 'n' then return decodeFloat64(data, pos), pos + 8
+  elseif tag == 's' then return decodeString(data, pos)
+  elseif tag == 'f' then return decodeArray(data, pos, decodeFloat32)
+  elseif tag == 'i' then return decodeArray(data, pos, decodeInt32)
+  end
+
+  local count = decodeUInt32(data, pos)
+  local result = {}
+  pos = pos + 4
+  if tag == 'l' then
+    for i = 1, count do
+      result[i], pos = decodeValue(data, pos)
+    end
+  elseif tag == 'd' or tag == 'm' then
+    if tag == 'm' then
+      for i = 1, count do
+        result[i], pos = decodeValue(data, pos)
+      end
+      count = decodeUInt32(data, pos)
+      pos = pos + 4
+    end
+    for i = 1, count do
+      local key
+      key, pos = decodeString(data, pos)
+      result[key], pos = decodeValue(data, pos)
+    end
+  else
+    error(('unknown tag %q at byte %d'):format(tag, pos - 1))
+  end
+  return result, pos
+end
+
+-- Like loadfile: returns a function which returns the level definition, or nil
+-- and an error message.
+function loadLevelFile(filename)
+  local file, err = io.open(filename, 'rb')
+  if not file then return nil, err end
+  local data = file:read('*a')
+  file:close()
+
+  if data:sub(1, #kBinaryMagic) ~= kBinaryMagic then
+    return loadstring(data, '@' .. filename)
+  end
+
+  local version = data:byte(#kBinaryMagic + 1)
+  if not version or version < 1 or version > kBinaryVersion then
+    return nil, ('%s: unsupported binary level version %s'):format(
+        filename, tostring(version))
+  end
+
+  -- Decode on every call, so that each caller gets its own tables as it
+  -- would from a Lua level.
+  return function() return (decodeValue(data, #kBinaryMagic + 2)) end
+end
+
+--------------------------------------------------------------------------------
+-- Spatial index queries, for levels converted with `--index=grid` or
+-- `--index=quadtree`.
+--------------------------------------------------------------------------------
+local function addIndexed(result, buckets)
+  for layerName, numbers in pairs(buckets) do
+    local layer = result[layerName]
+    if not layer then
+      layer = {}
+      result[layerName] = layer
+    end
+    for i = 1, #numbers do layer[numbers[i]] = true end
+  end
+end
+
+local function overlaps(bounds, minX, minY, maxX, maxY)
+  return bounds[1] <= maxX and bounds[3] >= minX and
+         bounds[2] <= maxY and bounds[4] >= minY
+end
+
+local function queryQuadtree(result, node, minX, minY, maxX, maxY)
+  if not overlaps(node.bounds, minX, minY, maxX, maxY) then return end
+  if node.objects then addIndexed(result, node.objects) end
+  if node.children then
+    for i = 1, #node.children do
+      queryQuadtree(result, node.children[i], minX, minY, maxX, maxY)
+    end
+  end
+end
+
+-- Returns a table mapping layer names to sets of the numbers of the objects
+-- in that layer which may overlap the given rectangle, in level coordinates.
+-- Objects' own bounds can be checked for an exact answer.
+function queryLevelIndex(def, minX, minY, maxX, maxY)
+  local index = def._index
+  local result = {}
+  if index.type == 'quadtree' then
+    if index.root then
+      queryQuadtree(result, index.root, minX, minY, maxX, maxY)
+    end
+    return result
+  end
+
+  local cellSize = index.cell_size
+  for i = math.floor(minX / cellSize), math.floor(maxX / cellSize) do
+    for j = math.floor(minY / cellSize), math.floor(maxY / cellSize) do
+      local cell = index.cells[i .. ',' .. j]
+      if cell then addIndexed(result, cell) end
+    end
+  end
+  return result
+end
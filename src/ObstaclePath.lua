@@ -6,10 +6,14 @@ function ObstaclePath.new(cell, path, scale, offsetX, offsetY)
   
   local body = self:createBody_(MOAIBox2DBody.STATIC)
   for k, points in pairs(path) do
-    local verts = {}
-    for i = 1, #points do
-      verts[i * 2 - 1] = points[i].x * scale + offsetX
-      verts[i * 2] = points[i].y * scale + offsetY
+    -- Without a scale the chains are baked flat vertex arrays already.
+    local verts = points
+    if scale then
+      verts = {}
+      for i = 1, #points do
+        verts[i * 2 - 1] = points[i].x * scale + offsetX
+        verts[i * 2] = points[i].y * scale + offsetY
+      end
     end
 
     self.body:addChain(verts, true)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+"""Benchmarks for the SVG to level converter.
+
+Run from this directory, e.g. `python benchmark.py --paths 500`. Levels are
+generated with the given number of layers, paths per layer, segments per
+path, mix of segment kinds and depth of transformed groups around paths.
+Each stage of the conversion is timed separately, on the same level.
+
+Results can be saved as JSON with --output and compared to an earlier run
+with --baseline, in which case benchmarks slower than the baseline by more
+than --threshold are reported as regressions and the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import svg.path as svg
+import svg_to_level
+import triangulation
+
+SVG_HEADER = '<svg xmlns="http://www.w3.org/2000/svg" ' \
+             'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" ' \
+             'width="%d" height="%d">\n'
+
+SEGMENT_KINDS = ('line', 'cubic', 'quadratic', 'arc')
+
+def rounded_rect_path(x, y, w, h, r):
+  return ('M %f,%f L %f,%f A %f,%f 0 0 1 %f,%f L %f,%f A %f,%f 0 0 1 %f,%f '
+          'L %f,%f A %f,%f 0 0 1 %f,%f L %f,%f A %f,%f 0 0 1 %f,%f Z') % (
+      x + r, y, x + w - r, y, r, r, x + w, y + r,
+      x + w, y + h - r, r, r, x + w - r, y + h,
+      x + r, y + h, r, r, x, y + h - r,
+      x, y + r, r, r, x + r, y)
+
+def arc_level(num_arcs, seed=0):
+  """An SVG document with num_arcs arcs, as rounded rectangles."""
+  rng = random.Random(seed)
+  width, height = 4096, 4096
+  pieces = [SVG_HEADER % (width, height),
+            '<g inkscape:label="Collisions" inkscape:groupmode="layer">\n']
+  for i in xrange((num_arcs + 3) // 4):
+    w, h = rng.uniform(40, 400), rng.uniform(40, 400)
+    x, y = rng.uniform(0, width - w), rng.uniform(0, height - h)
+    r = rng.uniform(5, min(w, h) / 2)
+    pieces.append('<path id="rr%d" d="%s"/>\n' %
+                  (i, rounded_rect_path(x, y, w, h, r)))
+  pieces.append('</g>\n</svg>\n')
+  return ''.join(pieces)
+
+def traced_path_data(num_nodes, seed=0):
+  """Path data like that of traced terrain: relative lines and curves in
+  Inkscape's compact number formatting."""
+  rng = random.Random(seed)
+  pieces = ['M 100.5,200.25']
+  for i in xrange(num_nodes):
+    kind = rng.random()
+    if kind < .5:
+      pieces.append('l %g,%g' % (rng.uniform(-20, 20), rng.uniform(-20, 20)))
+    elif kind < .9:
+      pieces.append('c %g,%g %g,%g %g,%g' % tuple(
+          rng.uniform(-20, 20) for _ in xrange(6)))
+    else:
+      pieces.append('a %g,%g 0 0,1 %g,%g' % (
+          rng.uniform(5, 20), rng.uniform(5, 20),
+          rng.uniform(-20, 20), rng.uniform(-20, 20)))
+  pieces.append('z')
+  return ' '.join(pieces)
+
+def terrain_polygon(num_nodes, seed=0):
+  """A polygon like traced terrain: a rough ground line of num_nodes points,
+  closed along a flat bottom, as complex points."""
+  rng = random.Random(seed)
+  points, y = [], 0.0
+  for i in xrange(num_nodes):
+    y = min(max(y + rng.uniform(-1, 1), -50), 50)
+    points.append(complex(i * .5, 100 + y))
+  return points + [complex((num_nodes - 1) * .5, 0), 0j]
+
+def parse_mix(text):
+  """Parse a segment mix such as 'line=2,cubic=1' into relative weights for
+  each of SEGMENT_KINDS."""
+  mix = dict.fromkeys(SEGMENT_KINDS, 0.0)
+  for item in text.split(','):
+    kind, _, weight = item.partition('=')
+    if kind not in mix:
+      raise argparse.ArgumentTypeError('unknown segment kind %r' % kind)
+    mix[kind] = float(weight or 1)
+  if not sum(mix.values()):
+    raise argparse.ArgumentTypeError('the segment mix is empty')
+  return mix
+
+def random_path_data(rng, num_segments, mix, x, y, size):
+  """A closed path of num_segments segments, drawn from mix, wandering
+  around a square of the given size at (x, y)."""
+  kinds = [kind for kind in SEGMENT_KINDS if mix[kind]]
+  weights = [mix[kind] for kind in kinds]
+  point = lambda: '%.3f,%.3f' % (x + rng.uniform(0, size),
+                                 y + rng.uniform(0, size))
+  pieces = ['M', point()]
+  for _ in xrange(num_segments):
+    kind = kinds[-1]
+    r = rng.uniform(0, sum(weights))
+    for k, w in zip(kinds, weights):
+      if r < w:
+        kind = k
+        break
+      r -= w
+    if kind == 'line':
+      pieces += ['L', point()]
+    elif kind == 'cubic':
+      pieces += ['C', point(), point(), point()]
+    elif kind == 'quadratic':
+      pieces += ['Q', point(), point()]
+    else:
+      pieces += ['A', '%.3f,%.3f' % (rng.uniform(.1, .5) * size,
+                                     rng.uniform(.1, .5) * size),
+                 '%.1f' % rng.uniform(0, 360),
+                 '%d,%d' % (rng.random() < .5, rng.random() < .5), point()]
+  pieces.append('Z')
+  return ' '.join(pieces)
+
+def synthetic_level(layers, paths, segments, mix, depth, seed=0):
+  """An SVG document with the given number of layers, each with paths of
+  segments segments drawn from mix. Every path is nested in depth groups,
+  each with its own transform."""
+  rng = random.Random(seed)
+  width, height = 4096, 4096
+  pieces = [SVG_HEADER % (width, height)]
+  for layer in xrange(layers):
+    pieces.append('<g inkscape:label="Layer%d" inkscape:groupmode="layer">\n'
+                  % layer)
+    for i in xrange(paths):
+      for _ in xrange(depth):
+        if rng.random() < .5:
+          transform = 'translate(%.3f,%.3f)' % (rng.uniform(-20, 20),
+                                                rng.uniform(-20, 20))
+        else:
+          transform = 'matrix(1,0,0,1,%.3f,%.3f)' % (rng.uniform(-20, 20),
+                                                     rng.uniform(-20, 20))
+        pieces.append('<g transform="%s">' % transform)
+      size = rng.uniform(20, 200)
+      pieces.append('<path id="l%dp%d" d="%s"/>' % (
+          layer, i, random_path_data(rng, segments, mix,
+                                     rng.uniform(200, width - 400),
+                                     rng.uniform(200, height - 400), size)))
+      pieces.append('</g>' * depth + '\n')
+    pieces.append('</g>\n')
+  pieces.append('</svg>\n')
+  return ''.join(pieces)
+
+def conversion_opts():
+  return {'refinement': 18.0, 'flatten': 'uniform', 'tolerance': 1.0,
+          'simplify': 'none', 'simplify_tolerance': 0.5, 'min_edge': 0.005,
+          'scale': 100.0, 'height': None, 'units': 'px', 'schema': 'layers',
+          'validate': 'none', 'use': 'expand', 'cache': None}
+
+def best_of(repeat, fn, *args):
+  times = []
+  for _ in xrange(repeat):
+    start = time.time()
+    fn(*args)
+    times.append(time.time() - start)
+  return min(times)
+
+def bench_arc_point(arcs, samples):
+  for arc in arcs:
+    for i in xrange(samples):
+      arc.point(i / float(samples))
+
+def bench_arc_length(arcs):
+  for arc in arcs:
+    arc.length()
+
+def bench_parse_path(pathdefs):
+  for d in pathdefs: svg.parse_path(d)
+
+def bench_path_length(paths):
+  # New paths, so that no lengths are cached from an earlier run.
+  for segments in paths: svg.Path(*segments).length()
+
+def bench_path_to_polygon(paths, opts):
+  for path in paths: svg_to_level.path_to_polygon(path, opts)
+
+def bench_parse_svg(filename):
+  return svg_to_level.parse_svg(filename, conversion_opts())
+
+def bench_convert(filename):
+  svg_to_level.level_to_lua(bench_parse_svg(filename))
+
+def run(args, filenames):
+  """Run every benchmark, returning a dict of benchmark name to the best of
+  args.repeat times in seconds."""
+  results = {}
+  def record(name, fn, *fn_args):
+    results[name] = best_of(args.repeat, fn, *fn_args)
+    print '%-24s %10.4f s' % (name, results[name])
+    sys.stdout.flush()
+
+  level, arcs_level = filenames
+  with open(level) as f:
+    pathdefs = [element.get('d') for element in svg_to_level.etree.parse(f)
+                .iter(svg_to_level.PATH_TAG)]
+  paths = [svg.parse_path(d) for d in pathdefs]
+  segments = [list(path) for path in paths]
+  parsed = bench_parse_svg(level)
+
+  record('parse_path', bench_parse_path, pathdefs)
+  record('path_length', bench_path_length, segments)
+  # path_to_polygon takes paths in world units, as wide as the document.
+  opts = conversion_opts()
+  record('path_to_polygon', bench_path_to_polygon, paths,
+         dict(opts, dims=opts['scale'] * (1 + 1j)))
+  record('parse_svg', bench_parse_svg, level)
+  record('level_to_lua', svg_to_level.level_to_lua, parsed)
+
+  with open(arcs_level) as f:
+    arcs = [segment for element in svg_to_level.etree.parse(f)
+            .iter(svg_to_level.PATH_TAG)
+            for segment in svg.parse_path(element.get('d'))
+            if isinstance(segment, svg.Arc)]
+  record('arc_point_x100', bench_arc_point, arcs, 100)
+  record('arc_length', bench_arc_length, arcs)
+  record('convert_arcs', bench_convert, arcs_level)
+  record('parse_traced_path', bench_parse_path,
+         [traced_path_data(args.path_nodes)])
+  record('triangulate', triangulation.triangulate,
+         terrain_polygon(args.terrain_nodes))
+  return results
+
+def compare(results, baseline, threshold):
+  """Print how results compare to baseline, returning the names of the
+  benchmarks slower by more than threshold, a fraction."""
+  regressions = []
+  print '\n%-24s %10s %10s %8s' % ('Benchmark', 'Baseline', 'Now', 'Change')
+  for name in sorted(results):
+    if name not in baseline: continue
+    before, after = baseline[name], results[name]
+    change = after / before - 1 if before else 0.0
+    flag = ''
+    if change > threshold:
+      regressions.append(name)
+      flag = '  REGRESSION'
+    print '%-24s %10.4f %10.4f %+7.1f%%%s' % (
+        name, before, after, change * 100, flag)
+  return regressions
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Converter benchmarks.')
+  parser.add_argument('--layers', type=int, default=4,
+      help='Number of layers in the synthetic level.')
+  parser.add_argument('--paths', type=int, default=100,
+      help='Number of paths in each layer.')
+  parser.add_argument('--segments', type=int, default=20,
+      help='Number of segments in each path.')
+  parser.add_argument('--mix', type=parse_mix,
+      default=parse_mix('line=4,cubic=3,quadratic=2,arc=1'),
+      help='Relative weights of the segment kinds, e.g. line=1,arc=2. Kinds '
+           'are %s.' % ', '.join(SEGMENT_KINDS))
+  parser.add_argument('--depth', type=int, default=3,
+      help='Number of transformed groups around each path.')
+  parser.add_argument('--seed', type=int, default=0,
+      help='Seed of the random level generator.')
+  parser.add_argument('--arcs', type=int, default=400,
+      help='Number of arcs in the arc level.')
+  parser.add_argument('--path-nodes', type=int, default=50000,
+      help='Number of nodes in the path data parsing benchmark.')
+  parser.add_argument('--terrain-nodes', type=int, default=5000,
+      help='Number of vertices of the polygon in the triangulation '
+           'benchmark.')
+  parser.add_argument('--repeat', type=int, default=3,
+      help='Number of runs per benchmark, the best one is reported.')
+  parser.add_argument('--output', type=str, default=None,
+      help='Save the results to this JSON file.')
+  parser.add_argument('--baseline', type=str, default=None,
+      help='Compare the results to those saved in this JSON file.')
+  parser.add_argument('--threshold', type=float, default=0.1,
+      help='Fraction by which a benchmark has to be slower than the '
+           'baseline to be reported as a regression.')
+  args = parser.parse_args()
+
+  params = {'layers': args.layers, 'paths': args.paths,
+            'segments': args.segments, 'mix': args.mix, 'depth': args.depth,
+            'seed': args.seed, 'arcs': args.arcs,
+            'path_nodes': args.path_nodes,
+            'terrain_nodes': args.terrain_nodes, 'repeat': args.repeat}
+  documents = [synthetic_level(args.layers, args.paths, args.segments,
+                               args.mix, args.depth, args.seed),
+               arc_level(args.arcs, args.seed)]
+  filenames = []
+  try:
+    for document in documents:
+      handle, filename = tempfile.mkstemp(suffix='.svg')
+      filenames.append(filename)
+      with os.fdopen(handle, 'w') as f: f.write(document)
+    results = run(args, filenames)
+  finally:
+    for filename in filenames: os.remove(filename)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'params': params, 'python': platform.python_version(),
+                 'results': results}, f, indent=2, separators=(',', ': '),
+                sort_keys=True)
+      f.write('\n')
+
+  if args.baseline:
+    with open(args.baseline) as f: baseline = json.load(f)
+    if baseline['params'] != params:
+      print 'W: The baseline was run with different parameters: %s' % (
+          json.dumps(baseline['params'], sort_keys=True))
+    regressions = compare(results, baseline['results'], args.threshold)
+    if regressions:
+      print '\n%d regression(s): %s' % (len(regressions),
+                                        ', '.join(regressions))
+      sys.exit(1)
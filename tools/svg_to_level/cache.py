@@ -0,0 +1,101 @@
+"""Size-bounded on-disk cache for the SVG to level converter.
+
+Values are pickled into one file per key. Reading an entry refreshes its
+modification time, and the least recently used entries are evicted first.
+MemoryCache keeps recently used values in memory in front of a Cache,
+bounded by their number or, for string values, their total size.
+"""
+
+import collections
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+
+def make_key(*parts):
+  digest = hashlib.sha1()
+  for part in parts:
+    digest.update(part if isinstance(part, str) else repr(part))
+    digest.update('\0')
+  return digest.hexdigest()
+
+class Cache(object):
+  def __init__(self, directory, max_bytes):
+    self.directory = directory
+    self.max_bytes = max_bytes
+
+  def _path(self, key):
+    return os.path.join(self.directory, key)
+
+  def get(self, key, default=None):
+    path = self._path(key)
+    try:
+      with open(path, 'rb') as f: value = pickle.load(f)
+      os.utime(path, None)
+      return value
+    except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+      return default
+
+  def put(self, key, value):
+    if not os.path.isdir(self.directory): os.makedirs(self.directory)
+    # Write then rename, so that concurrent readers never see partial data.
+    handle, temp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+    with os.fdopen(handle, 'wb') as f:
+      pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(temp, self._path(key))
+
+  def evict(self):
+    """Remove least recently used entries until the cache fits its size."""
+    entries = []
+    try: names = os.listdir(self.directory)
+    except OSError: return
+    for name in names:
+      try: stat = os.stat(self._path(name))
+      except OSError: continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    entries.sort()
+    for _, size, name in entries:
+      if total <= self.max_bytes: break
+      try: os.remove(self._path(name))
+      except OSError: continue
+      total -= size
+
+class MemoryCache(object):
+  def __init__(self, backing=None, max_entries=65536, max_bytes=None):
+    self.backing = backing
+    self.max_entries = max_entries
+    # Values must be strings to be bounded by size.
+    self.max_bytes = max_bytes
+    self.bytes = 0
+    self.entries = collections.OrderedDict()
+
+  def _size(self, value):
+    return len(value) if self.max_bytes is not None else 0
+
+  def _store(self, key, value):
+    if key in self.entries: self.bytes -= self._size(self.entries.pop(key))
+    self.entries[key] = value
+    self.bytes += self._size(value)
+    while len(self.entries) > self.max_entries or \
+        (self.max_bytes is not None and self.bytes > self.max_bytes):
+      self.bytes -= self._size(self.entries.popitem(last=False)[1])
+
+  def get(self, key, default=None):
+    if key in self.entries:
+      value = self.entries.pop(key)
+      self.entries[key] = value
+      return value
+
+    value = self.backing.get(key) if self.backing else None
+    if value is None: return default
+    self._store(key, value)
+    return value
+
+  def put(self, key, value):
+    self._store(key, value)
+    if self.backing: self.backing.put(key, value)
+
+  def evict(self):
+    if self.backing: self.backing.evict()
@@ -0,0 +1,89 @@
+"""Conversion of levels to the definition schema src/Level.lua consumes.
+
+The level is baked into the game's world coordinates, so Level.lua uses it
+as is: collisions are flat [x1, y1, x2, y2, ...] chains for addChain, open
+at the end since addChain closes them, quads are tables of four {x, y}
+points at 1 to 4 and of the image they show under 'link', and the player and
+goal are single {x, y} points. The table is marked 'baked' to tell it apart
+from definitions in document pixels.
+"""
+
+import math
+import os
+import spatial
+
+# Game layer names by the (lower case) name of the SVG layer.
+CHAIN_LAYERS = {'collisions': 'Collisions'}
+QUAD_LAYERS = {'dangers': 'Dangers', 'algae': 'Algae',
+               'litalgae': 'LitAlgae', 'cosmetics': 'Cosmetics',
+               'text': 'Text'}
+POINT_LAYERS = {'player': 'Player', 'goal': 'Goal'}
+
+# Layers the game indexes without checking that they exist.
+REQUIRED_LAYERS = ('Collisions', 'Dangers', 'Algae', 'LitAlgae', 'Cosmetics')
+
+def link_name(link):
+  """The name under which the game knows the image at link."""
+  return os.path.basename(link)
+
+def circle_to_chain(circle, spacing):
+  x, y, r = circle
+  n = max(8, int(math.ceil(2 * math.pi * r / spacing)))
+  chain = []
+  for i in xrange(n):
+    angle = 2 * math.pi * i / n
+    chain.append(x + r * math.cos(angle))
+    chain.append(y + r * math.sin(angle))
+  return chain
+
+def object_to_chain(obj, spacing):
+  if 'circle' in obj: return circle_to_chain(obj['circle'], spacing)
+  chain = obj['poly']
+  if len(chain) > 2 and chain[:2] == chain[-2:]: chain = chain[:-2]
+  return chain
+
+def object_to_quad(obj):
+  poly = obj.get('poly')
+  if not poly or len(poly) != 8: return None
+  quad = dict(enumerate(({'x': x, 'y': y}
+                         for x, y in zip(poly[0::2], poly[1::2])), 1))
+  if 'link' in obj: quad['link'] = obj['link']
+  return quad
+
+def object_centre(obj):
+  if 'circle' in obj: return {'x': obj['circle'][0], 'y': obj['circle'][1]}
+  bounds = spatial.object_bounds(obj)
+  return {'x': (bounds[0] + bounds[2]) * .5, 'y': (bounds[1] + bounds[3]) * .5}
+
+def to_game_level(level, spacing, width):
+  """The game definition of level, a converted level with objects in world
+  units. Circles become chains with vertices about spacing apart. width is
+  the world width recorded in the definition."""
+  game = {'width': width, 'baked': True}
+  for name in REQUIRED_LAYERS: game[name] = []
+
+  for layer, objects in sorted(level.iteritems()):
+    if layer in CHAIN_LAYERS:
+      game[CHAIN_LAYERS[layer]] = [object_to_chain(obj, spacing)
+                                   for obj in objects]
+    elif layer in QUAD_LAYERS:
+      quads = game[QUAD_LAYERS[layer]] = []
+      for number, obj in enumerate(objects, 1):
+        quad = object_to_quad(obj)
+        if quad is None:
+          print 'W: Object %d of layer %s is not a rectangle or image, ' \
+                'skipping it.' % (number, layer)
+        else:
+          quads.append(quad)
+    elif layer in POINT_LAYERS:
+      if not objects: continue
+      if len(objects) > 1:
+        print 'W: Layer %s has %d objects, using the first.' % (
+            layer, len(objects))
+      game[POINT_LAYERS[layer]] = object_centre(objects[0])
+    else:
+      print 'W: Layer %s is not used by the game, skipping it.' % layer
+
+  for name in POINT_LAYERS.itervalues():
+    if name not in game: print 'W: The level has no %s.' % name
+  return game
@@ -0,0 +1,100 @@
+"""Polygon helpers for the SVG to level converter.
+
+Points are complex numbers, as elsewhere in the converter. A closed polygon
+repeats its first point at the end.
+"""
+
+import heapq
+
+def segment_distance(p, a, b):
+  """Distance from p to the segment between a and b."""
+  ab = b - a
+  ab_sq = ab.real * ab.real + ab.imag * ab.imag
+  if ab_sq == 0: return abs(p - a)
+  ap = p - a
+  t = (ap.real * ab.real + ap.imag * ab.imag) / ab_sq
+  return abs(ap - ab * min(max(t, 0.0), 1.0))
+
+def triangle_area(a, b, c):
+  ab, ac = b - a, c - a
+  return abs(ab.real * ac.imag - ab.imag * ac.real) * .5
+
+def simplify_rdp(points, tolerance):
+  """Ramer-Douglas-Peucker: keep the fewest points such that every dropped
+  point is within tolerance of the simplified polyline."""
+  n = len(points)
+  if n < 3: return list(points)
+
+  keep = [False] * n
+  keep[0] = keep[-1] = True
+  stack = [(0, n - 1)]
+  while stack:
+    first, last = stack.pop()
+    a, b = points[first], points[last]
+    index, max_distance = None, tolerance
+    for i in xrange(first + 1, last):
+      distance = segment_distance(points[i], a, b)
+      if distance > max_distance: index, max_distance = i, distance
+    if index is not None:
+      keep[index] = True
+      stack.append((first, index))
+      stack.append((index, last))
+
+  return [p for p, k in zip(points, keep) if k]
+
+def simplify_visvalingam(points, tolerance):
+  """Visvalingam-Whyatt: repeatedly drop the point spanning the smallest
+  triangle with its neighbours, while that area is below tolerance squared."""
+  n = len(points)
+  if n < 3: return list(points)
+
+  threshold = tolerance * tolerance
+  prev = range(-1, n - 1)
+  next = range(1, n + 1)
+  area = [None] * n
+  heap = []
+  for i in xrange(1, n - 1):
+    area[i] = triangle_area(points[i - 1], points[i], points[i + 1])
+    heap.append((area[i], i))
+  heapq.heapify(heap)
+
+  removed = [False] * n
+  while heap:
+    a, i = heapq.heappop(heap)
+    if removed[i] or a != area[i]: continue
+    if a >= threshold: break
+
+    removed[i] = True
+    before, after = prev[i], next[i]
+    next[before], prev[after] = after, before
+    for j in (before, after):
+      if 0 < j < n - 1:
+        area[j] = triangle_area(points[prev[j]], points[j], points[next[j]])
+        heapq.heappush(heap, (area[j], j))
+
+  return [p for p, r in zip(points, removed) if not r]
+
+def remove_short_edges(points, min_length):
+  """Drop points closer than min_length to their predecessor, always keeping
+  the first and last points."""
+  if len(points) < 2: return list(points)
+
+  result = [points[0]]
+  for p in points[1:-1]:
+    if abs(p - result[-1]) > min_length: result.append(p)
+
+  last = points[-1]
+  while len(result) > 1 and abs(last - result[-1]) <= min_length: result.pop()
+  result.append(last)
+  return result
+
+SIMPLIFIERS = {
+    'rdp': simplify_rdp,
+    'visvalingam': simplify_visvalingam,
+}
+
+def simplify(points, method, tolerance, min_edge):
+  """Simplify a polyline with the named method and ensure none of its edges
+  are min_edge or shorter."""
+  points = SIMPLIFIERS[method](list(points), tolerance)
+  return remove_short_edges(points, min_edge)
@@ -0,0 +1,119 @@
+"""Compact binary encoding of converted levels.
+
+The level is written as a tree of tagged values, all little-endian, after a
+four byte magic number and a one byte format version:
+
+  'T', 'F'  true and false
+  'n'       number, as a float64
+  's'       string, as a uint32 byte count followed by the bytes
+  'f'       list of numbers, as a uint32 count followed by float32s
+  'i'       list of integers, as a uint32 count followed by int32s
+  'l'       list of other values, as a uint32 count followed by the values
+  'd'       table, as a uint32 count followed by (key, value) pairs, where
+            each key is a string without its 's' tag
+  'm'       table with both a list part, at keys 1 to n, and string keys,
+            as the list part as in 'l' followed by the rest as in 'd'
+
+Fields whose value is None are left out of tables, as nil is in Lua.
+
+Coordinate lists are the bulk of a level and become packed float32 arrays.
+Tables are written with their keys sorted, so the output is deterministic.
+src/LevelFile.lua decodes this format in the game.
+"""
+
+import numbers
+import struct
+
+MAGIC = 'LVLB'
+VERSION = 2
+
+def _count(n):
+  return struct.pack('<I', n)
+
+def _encode_string(s, out):
+  if isinstance(s, unicode): s = s.encode('utf-8')
+  out.append(_count(len(s)))
+  out.append(s)
+
+def _is_number(value):
+  return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+def _encode(value, out):
+  if value is True or value is False:
+    out.append('T' if value else 'F')
+  elif _is_number(value):
+    out.append('n' + struct.pack('<d', value))
+  elif isinstance(value, basestring):
+    out.append('s')
+    _encode_string(value, out)
+  elif isinstance(value, dict):
+    # A nil field is no field in Lua, as write_lua leaves it.
+    value = dict((k, v) for k, v in value.iteritems() if v is not None)
+    n = sum(1 for key in value if not isinstance(key, basestring))
+    if n:
+      out.append('m' + _count(n))
+      for i in xrange(1, n + 1): _encode(value[i], out)
+      out.append(_count(len(value) - n))
+    else:
+      out.append('d' + _count(len(value)))
+    for key in sorted(k for k in value if isinstance(k, basestring)):
+      _encode_string(key, out)
+      _encode(value[key], out)
+  elif value and all(_is_number(x) for x in value):
+    if all(isinstance(x, (int, long)) for x in value):
+      out.append('i' + _count(len(value)) +
+                 struct.pack('<%di' % len(value), *value))
+    else:
+      out.append('f' + _count(len(value)) +
+                 struct.pack('<%df' % len(value), *value))
+  else:
+    out.append('l' + _count(len(value)))
+    for x in value: _encode(x, out)
+
+def dumps(level):
+  """The binary encoding of level, as a string."""
+  out = [MAGIC, chr(VERSION)]
+  _encode(level, out)
+  return ''.join(out)
+
+def loads(data):
+  """Decode a level written by dumps, e.g. to inspect or compare levels."""
+  if data[:len(MAGIC)] != MAGIC:
+    raise ValueError('Not a binary level')
+  if not 1 <= ord(data[len(MAGIC)]) <= VERSION:
+    raise ValueError('Unsupported binary level version %d' %
+                     ord(data[len(MAGIC)]))
+
+  def count(pos):
+    return struct.unpack_from('<I', data, pos)[0], pos + 4
+
+  def string(pos):
+    n, pos = count(pos)
+    return data[pos:pos + n], pos + n
+
+  def value(pos):
+    tag, pos = data[pos], pos + 1
+    if tag in 'TF': return tag == 'T', pos
+    if tag == 'n': return struct.unpack_from('<d', data, pos)[0], pos + 8
+    if tag == 's': return string(pos)
+    n, pos = count(pos)
+    if tag in 'fi':
+      return list(struct.unpack_from('<%d%s' % (n, tag), data, pos)), pos + 4 * n
+    if tag == 'l':
+      result = []
+      for _ in xrange(n):
+        x, pos = value(pos)
+        result.append(x)
+      return result, pos
+    if tag in 'dm':
+      result = {}
+      if tag == 'm':
+        for i in xrange(1, n + 1): result[i], pos = value(pos)
+        n, pos = count(pos)
+      for _ in xrange(n):
+        key, pos = string(pos)
+        result[key], pos = value(pos)
+      return result, pos
+    raise ValueError('Unknown tag %r at byte %d' % (tag, pos - 1))
+
+  return value(len(MAGIC) + 1)[0]
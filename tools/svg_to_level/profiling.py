@@ -0,0 +1,90 @@
+"""Per-stage and per-element timing of conversions, for --profile.
+
+Stages nest, and are named after the stage they are part of, e.g. the time
+in 'flatten/length' is also counted in 'flatten'. The helpers accept None
+for the profile, in which case they do nothing, so that code can be
+instrumented unconditionally.
+"""
+
+import collections
+import heapq
+import time
+
+class NullStage(object):
+  def __enter__(self): pass
+  def __exit__(self, *exc_info): pass
+
+NULL_STAGE = NullStage()
+
+class Stage(object):
+  def __init__(self, profile, name):
+    self.profile = profile
+    self.name = name
+
+  def __enter__(self):
+    self.start = time.time()
+
+  def __exit__(self, *exc_info):
+    self.profile.add(self.name, time.time() - self.start)
+
+class Profile(object):
+  def __init__(self):
+    self.start = time.time()
+    self.stages = collections.OrderedDict()
+    self.elements = []
+    self.filename = None
+    self.current = None
+
+  def add(self, name, seconds, calls=1):
+    stage = self.stages.setdefault(name, [0.0, 0])
+    stage[0] += seconds
+    stage[1] += calls
+
+  def begin_element(self, element):
+    self.current = {'file': self.filename, 'id': element.get('id'),
+                    'tag': element.tag[element.tag.rfind('}') + 1:],
+                    'segments': 0, 'start': time.time()}
+
+  def count_segments(self, n):
+    if self.current: self.current['segments'] += n
+
+  def end_element(self, obj):
+    current, self.current = self.current, None
+    seconds = time.time() - current.pop('start')
+    current['vertices'] = len(obj.get('poly', ())) // 2
+    self.add('element', seconds)
+    self.elements.append((seconds, current))
+
+  def report(self, out, top=10):
+    out.write('%-24s %10s %10s\n' % ('Stage', 'Seconds', 'Calls'))
+    for name, (seconds, calls) in self.stages.iteritems():
+      out.write('%-24s %10.3f %10d\n' % (name, seconds, calls))
+    out.write('%-24s %10.3f\n' % ('total', time.time() - self.start))
+
+    slowest = heapq.nlargest(top, self.elements, key=lambda e: e[0])
+    if not slowest: return
+    out.write('\nSlowest %d elements:\n' % len(slowest))
+    out.write('%10s %10s %10s  %s\n' % (
+        'Seconds', 'Segments', 'Vertices', 'Element'))
+    for seconds, e in slowest:
+      out.write('%10.4f %10d %10d  %s#%s (%s)\n' % (
+          seconds, e['segments'], e['vertices'], e['file'], e['id'], e['tag']))
+
+def stage(profile, name):
+  """A context manager timing the stage name, if profiling."""
+  return Stage(profile, name) if profile else NULL_STAGE
+
+def timed_iter(profile, name, iterable):
+  """Iterate over iterable, counting the time taken to produce each item in
+  the stage name, if profiling."""
+  if not profile: return iterable
+  return _timed_iter(profile, name, iter(iterable))
+
+def _timed_iter(profile, name, iterator):
+  while True:
+    start = time.time()
+    try:
+      item = next(iterator)
+    finally:
+      profile.add(name, time.time() - start)
+    yield item
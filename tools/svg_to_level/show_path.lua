@@ -1,4 +1,6 @@
 #!moai
+dofile('../../src/LevelFile.lua')
+
 MOAISim.openWindow('Path', 1280, 720)
 
 local viewport = MOAIViewport.new()
@@ -18,20 +20,32 @@ local world = MOAIBox2DWorld.new()
 layer:setBox2DWorld(world)
 
 local body = world:addBody(MOAIBox2DBody.STATIC)
-local loader, err = loadfile('path.lua')
+-- The level to show, path.lua unless LEVEL_FILE names another, such as a
+-- --format=binary path.bin.
+local loader, err = loadLevelFile(os.getenv('LEVEL_FILE') or 'path.lua')
 if not loader then
   print(err)
 else
-  for layerName, layer in pairs(loader()) do
-    for iObject, object in pairs(layer) do
-      if object.poly then
-        body:addChain(object.poly)
-        for iCoord = 1, #object.poly / 2 do
-          body:addCircle(
-              object.poly[iCoord * 2 - 1], object.poly[iCoord * 2], 0.2)
+  local def = loader()
+  if def.baked then
+    -- A --schema=game definition, of which only the collisions are drawn.
+    for iChain, chain in ipairs(def.Collisions) do
+      body:addChain(chain, true)
+    end
+  else
+    for layerName, layer in pairs(def) do
+      -- Keys starting with an underscore, such as _index, are not layers.
+      if layerName:sub(1, 1) == '_' then layer = {} end
+      for iObject, object in pairs(layer) do
+        if object.poly then
+          body:addChain(object.poly)
+          for iCoord = 1, #object.poly / 2 do
+            body:addCircle(
+                object.poly[iCoord * 2 - 1], object.poly[iCoord * 2], 0.2)
+          end
+        elseif object.circle then
+          body:addCircle(unpack(object.circle))
         end
-      elseif object.circle then
-        body:addCircle(unpack(object.circle))
       end
     end
   end
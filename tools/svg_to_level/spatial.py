@@ -0,0 +1,224 @@
+"""Spatial indexing of converted levels.
+
+Works on levels as produced by the converter, in final game coordinates:
+polygons are flat [x1, y1, x2, y2, ...] lists and circles are [x, y, radius].
+Bounds are [min_x, min_y, max_x, max_y] lists. Objects are referred to by
+layer name and their 1-based position in the layer, as they are numbered in
+Lua. Cell (i, j) covers [i * cell_size, (i + 1) * cell_size) horizontally
+and likewise vertically, and is keyed by the string 'i,j'.
+"""
+
+import math
+
+# Objects a quadtree node holds before it is split.
+QUADTREE_NODE_OBJECTS = 8
+
+# Key of the table of prototypes of instances, with --use=table.
+PROTOTYPES_KEY = '_prototypes'
+
+def transform_bounds(t, bounds):
+  """The bounds of the corners of bounds under the transform t."""
+  a, b, c, d, e, f = t
+  corners = [(x, y) for x in (bounds[0], bounds[2])
+             for y in (bounds[1], bounds[3])]
+  xs = [a * x + c * y + e for x, y in corners]
+  ys = [b * x + d * y + f for x, y in corners]
+  return [min(xs), min(ys), max(xs), max(ys)]
+
+def prototype_bounds(prototypes):
+  """The bounds of each prototype in the table of prototypes, by id."""
+  bounds = {}
+  def of(id):
+    if id not in bounds:
+      # Left None while the prototype's own objects are visited, should one
+      # of them be an instance of it.
+      bounds[id] = None
+      boxes = []
+      for obj in prototypes.get(id, ()):
+        if 'use' in obj: of(obj['use'])
+        boxes.append(object_bounds(obj, bounds))
+      boxes = filter(None, boxes)
+      bounds[id] = union_bounds(boxes) if boxes else None
+  for id in prototypes: of(id)
+  return bounds
+
+def object_bounds(obj, prototypes=None):
+  """The bounds of obj, if it has any. Those of an instance are those of
+  its prototype in prototypes, bounds by id as from prototype_bounds,
+  placed."""
+  if 'use' in obj:
+    bounds = (prototypes or {}).get(obj['use'])
+    return transform_bounds(obj['transform'], bounds) if bounds else None
+  if 'circle' in obj:
+    x, y, r = obj['circle']
+    return [x - r, y - r, x + r, y + r]
+  poly = obj.get('poly')
+  if not poly: return None
+  xs, ys = poly[0::2], poly[1::2]
+  return [min(xs), min(ys), max(xs), max(ys)]
+
+def union_bounds(bounds):
+  return [min(b[0] for b in bounds), min(b[1] for b in bounds),
+          max(b[2] for b in bounds), max(b[3] for b in bounds)]
+
+def cell_of(x, y, cell_size):
+  return int(math.floor(x / cell_size)), int(math.floor(y / cell_size))
+
+def cell_key(i, j):
+  return '%d,%d' % (i, j)
+
+def _crossings(a, b, cell_size):
+  """Parameters in (0, 1) at which the edge from a to b crosses grid lines."""
+  ts = []
+  for axis in (0, 1):
+    lo, hi = sorted((a[axis], b[axis]))
+    for k in xrange(int(math.floor(lo / cell_size)) + 1,
+                    int(math.ceil(hi / cell_size))):
+      ts.append((k * cell_size - a[axis]) / (b[axis] - a[axis]))
+  return sorted(t for t in ts if 0 < t < 1)
+
+def _run_cell(run, cell_size):
+  mid = ((run[0][0] + run[1][0]) * .5, (run[0][1] + run[1][1]) * .5)
+  return cell_of(mid[0], mid[1], cell_size)
+
+def split_polyline(points, cell_size):
+  """Split a polyline of (x, y) points where it crosses cell boundaries, into
+  runs which each lie within a single cell. Consecutive runs share their end
+  points. A closed polyline whose first and last runs lie in the same cell
+  has them joined."""
+  runs = [[points[0]]]
+  for a, b in zip(points, points[1:]):
+    for t in _crossings(a, b, cell_size):
+      p = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+      if p != runs[-1][-1]:
+        runs[-1].append(p)
+        runs.append([p])
+    if b != runs[-1][-1]: runs[-1].append(b)
+  runs = [run for run in runs if len(run) > 1]
+
+  if len(runs) > 1 and points[0] == points[-1] and \
+      _run_cell(runs[0], cell_size) == _run_cell(runs[-1], cell_size):
+    runs[0] = runs.pop() + runs[0][1:]
+  return runs
+
+def split_long_objects(objects, cell_size):
+  """Split polygons spanning more than one cell into open chains, one per
+  cell they pass through. Objects with a subclass or script are entities
+  placed by the game rather than geometry, and are left whole."""
+  result = []
+  for obj in objects:
+    poly = obj.get('poly')
+    bounds = object_bounds(obj)
+    if not poly or 'subclass' in obj or 'script' in obj or \
+        cell_of(bounds[0], bounds[1], cell_size) == \
+        cell_of(bounds[2], bounds[3], cell_size):
+      result.append(obj)
+      continue
+
+    runs = split_polyline(zip(poly[0::2], poly[1::2]), cell_size)
+    if len(runs) == 1:
+      result.append(obj)
+      continue
+    # The pieces are open chains, which have no inside to fill.
+    base = dict(obj)
+    base.pop('triangles', None)
+    for run in runs:
+      result.append(dict(base, poly=[c for p in run for c in p], open=True))
+  return result
+
+def _signed_area(points):
+  return sum(a[0] * b[1] - a[1] * b[0] for a, b in zip(points, points[1:]))
+
+def occluder_grid(chains, cell_size):
+  """Bucket the edges of closed chains of (x, y) points by cell, for casting
+  shadows. Chains are made counter-clockwise, so that the solid is to the
+  left of every edge and it faces outward to the right: the edge from a to b
+  faces a light at l when (b - a) x (l - a) < 0. Each cell holds the runs of
+  edges split_polyline cuts in it, as [x1, y1, x2, y2, ...] lists."""
+  cells = {}
+  for points in chains:
+    if points and points[0] != points[-1]: points = points + points[:1]
+    if len(points) < 4: continue
+    if _signed_area(points) < 0: points = points[::-1]
+    for run in split_polyline(points, cell_size):
+      cells.setdefault(cell_key(*_run_cell(run, cell_size)), []).append(
+          [c for p in run for c in p])
+  return {'cell_size': cell_size, 'cells': cells}
+
+def _layers(level):
+  # Keys starting with an underscore, such as _prototypes, are not layers.
+  return [(name, objects) for name, objects in sorted(level.iteritems())
+          if not name.startswith('_')]
+
+def _entries(level):
+  for layer, objects in _layers(level):
+    for number, obj in enumerate(objects, 1):
+      if obj.get('bounds'): yield layer, number, obj['bounds']
+
+def _add(buckets, layer, number):
+  buckets.setdefault(layer, []).append(number)
+
+def grid_index(level, cell_size):
+  """Map each cell to the objects whose bounds overlap it."""
+  cells = {}
+  for layer, number, bounds in _entries(level):
+    i0, j0 = cell_of(bounds[0], bounds[1], cell_size)
+    i1, j1 = cell_of(bounds[2], bounds[3], cell_size)
+    for i in xrange(i0, i1 + 1):
+      for j in xrange(j0, j1 + 1):
+        _add(cells.setdefault(cell_key(i, j), {}), layer, number)
+  return {'type': 'grid', 'cell_size': cell_size, 'cells': cells}
+
+def _contains(outer, inner):
+  return outer[0] <= inner[0] and outer[1] <= inner[1] and \
+         inner[2] <= outer[2] and inner[3] <= outer[3]
+
+def _quadtree_node(bounds, entries, cell_size):
+  node = {'bounds': bounds}
+  x0, y0, x1, y1 = bounds
+  if len(entries) > QUADTREE_NODE_OBJECTS and x1 - x0 > cell_size:
+    mx, my = (x0 + x1) * .5, (y0 + y1) * .5
+    children = []
+    for quadrant in ([x0, y0, mx, my], [mx, y0, x1, my],
+                     [x0, my, mx, y1], [mx, my, x1, y1]):
+      inside = [e for e in entries if _contains(quadrant, e[2])]
+      if inside:
+        children.append(_quadtree_node(quadrant, inside, cell_size))
+        entries = [e for e in entries if not _contains(quadrant, e[2])]
+    if children: node['children'] = children
+
+  objects = {}
+  for layer, number, _ in entries: _add(objects, layer, number)
+  if objects: node['objects'] = objects
+  return node
+
+def quadtree_index(level, cell_size):
+  """A quadtree over the level, where each node holds the objects whose
+  bounds fit in no single one of its children. Nodes are square and are not
+  split below cell_size."""
+  entries = list(_entries(level))
+  if not entries: return {'type': 'quadtree', 'cell_size': cell_size}
+  x0, y0, x1, y1 = union_bounds([e[2] for e in entries])
+  size = cell_size
+  while x0 + size < x1 or y0 + size < y1: size *= 2
+  root = _quadtree_node([x0, y0, x0 + size, y0 + size], entries, cell_size)
+  return {'type': 'quadtree', 'cell_size': cell_size, 'root': root}
+
+INDEXES = {
+    'grid': grid_index,
+    'quadtree': quadtree_index,
+}
+
+def index_level(level, method, cell_size, split_long=False):
+  """A copy of level with the bounds of every object and, under the key
+  '_index', an index of the given method over them."""
+  indexed = dict(level)
+  prototypes = prototype_bounds(level.get(PROTOTYPES_KEY, {}))
+  for layer, objects in _layers(level):
+    if split_long: objects = split_long_objects(objects, cell_size)
+    indexed[layer] = []
+    for obj in objects:
+      bounds = object_bounds(obj, prototypes)
+      indexed[layer].append(dict(obj, bounds=bounds) if bounds else obj)
+  indexed['_index'] = INDEXES[method](indexed, cell_size)
+  return indexed
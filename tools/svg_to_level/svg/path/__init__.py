@@ -1,2 +1,2 @@
-from .path import Path, Line, Arc, CubicBezier, QuadraticBezier
+from .path import Path, PackedPath, Line, Arc, CubicBezier, QuadraticBezier
 from .parser import parse_path
\ No newline at end of file
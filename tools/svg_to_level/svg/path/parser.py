@@ -6,111 +6,140 @@ from . import path
 COMMANDS = set('MmZzLlHhVvCcSsQqTtAa')
 UPPERCASE = set('MZLHVCSQTA')
 
-COMMAND_RE = re.compile("([MmZzLlHhVvCcSsQqTtAa])")
-FLOAT_RE = re.compile("[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?")
+# Number of arguments taken by each command.
+ARGUMENTS = {'M': 2, 'Z': 0, 'L': 2, 'H': 1, 'V': 1,
+             'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7}
+ARGUMENTS.update([(command.lower(), count)
+                  for command, count in ARGUMENTS.items()])
+
+# A single pass over the path data finds every command and number. Numbers
+# end wherever the next one can't continue them, so compact forms such as
+# "1.5.5" and "1e-3-2" split correctly.
+TOKEN_RE = re.compile(r"[MmZzLlHhVvCcSsQqTtAa]|"
+                      r"[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?")
+
+
+def _arc_arguments(tokens, index):
+    # The large arc and sweep flags are single characters, which may be
+    # packed against each other and the next number, as in "a1 1 0 1150 50".
+    arguments = []
+    for i in range(7):
+        token = tokens[index]
+        if i in (3, 4) and len(token) > 1 and token[0] in '01':
+            tokens[index] = token[1:]
+            token = token[0]
+        else:
+            index += 1
+        arguments.append(float(token))
+    return arguments, index
+
 
 def _tokenize_path(pathdef):
-    for x in COMMAND_RE.split(pathdef):
-        if x in COMMANDS:
-            yield x
-        for token in FLOAT_RE.findall(x):
-            yield token
+    """Scan pathdef once, yielding (command, arguments) for every explicit
+    and implicit command, with the arguments converted to floats."""
+    tokens = TOKEN_RE.findall(pathdef)
+    index, count = 0, len(tokens)
+    command = None
+    while index < count:
+        if tokens[index] in COMMANDS:
+            command = tokens[index]
+            index += 1
+        elif command is None or command in 'Zz':
+            raise ValueError("Unallowed implicit command in %s, position %s" % (
+                pathdef, index))
+
+        try:
+            if command in 'Aa':
+                arguments, index = _arc_arguments(tokens, index)
+            else:
+                end = index + ARGUMENTS[command]
+                if end > count:
+                    raise IndexError
+                arguments = map(float, tokens[index:end])
+                index = end
+        except (IndexError, ValueError):
+            raise ValueError("Missing arguments for %s in %s, position %s" % (
+                command, pathdef, index))
 
-def parse_path(pathdef, current_pos=0j):
+        yield command, arguments
+
+        # Implicit moveto commands are treated as lineto commands.
+        if command == 'M':
+            command = 'L'
+        elif command == 'm':
+            command = 'l'
+
+
+def parse_path(pathdef, current_pos=0j, packed=False):
     # In the SVG specs, initial movetos are absolute, even if
     # specified as 'm'. This is the default behavior here as well.
     # But if you pass in a current_pos variable, the initial moveto
     # will be relative to that current_pos. This is useful.
-    elements = list(_tokenize_path(pathdef))
-    # Reverse for easy use of .pop()
-    elements.reverse()
-    
-    segments = path.Path()
-    start_pos = None
+    # With packed, a PackedPath is returned instead of a Path.
+    # Segments are collected in a plain list, appending to a Path goes through
+    # MutableSequence.insert. A PackedPath is filled in directly.
+    segments = path.PackedPath() if packed else []
+    start_pos = current_pos
     command = None
-    
-    while elements:
-        
-        if elements[-1] in COMMANDS:
-            # New command.
-            last_command = command # Used by S and T
-            command = elements.pop()
-            absolute = command in UPPERCASE
-            command = command.upper()
-        else:
-            # If this element starts with numbers, it is an implicit command
-            # and we don't change the command. Check that it's allowed:
-            if command is None:
-                raise ValueError("Unallowed implicit command in %s, position %s" % (
-                    pathdef, len(pathdef.split()) - len(elements)))
-        
+
+    for command_letter, args in _tokenize_path(pathdef):
+        last_command = command # Used by S and T
+        absolute = command_letter in UPPERCASE
+        command = command_letter.upper()
+
         if command == 'M':
             # Moveto command.
-            x = elements.pop()
-            y = elements.pop()
-            pos = float(x) + float(y) * 1j
+            pos = args[0] + args[1] * 1j
             if absolute:
                 current_pos = pos
             else:
                 current_pos += pos
-            
-            if start_pos is None:
-                start_pos = current_pos
-            
-            # Implicit moveto commands are treated as lineto commands.
-            # So we set command to lineto here, in case there are
-            # further implicit commands after this moveto.
-            command = 'L'
-                
+            start_pos = current_pos
+
         elif command == 'Z':
             # Close path
             segments.append(path.Line(current_pos, start_pos))
             current_pos = start_pos
-            start_pos = None
-            
+
         elif command == 'L':
-            x = elements.pop()
-            y = elements.pop()
-            pos = float(x) + float(y) * 1j
+            pos = args[0] + args[1] * 1j
             if not absolute:
                 pos += current_pos
             segments.append(path.Line(current_pos, pos))
             current_pos = pos
-            
+
         elif command == 'H':
-            x = elements.pop()
-            pos = float(x) + current_pos.imag * 1j
+            pos = args[0] + current_pos.imag * 1j
             if not absolute:
                 pos += current_pos.real
             segments.append(path.Line(current_pos, pos))
             current_pos = pos
-            
+
         elif command == 'V':
-            y = elements.pop()
-            pos = current_pos.real + float(y) * 1j
+            pos = current_pos.real + args[0] * 1j
             if not absolute:
                 pos += current_pos.imag * 1j
             segments.append(path.Line(current_pos, pos))
             current_pos = pos
-        
+
         elif command == 'C':
-            control1 = float(elements.pop()) + float(elements.pop()) * 1j
-            control2 = float(elements.pop()) + float(elements.pop()) * 1j
-            end = float(elements.pop()) + float(elements.pop()) * 1j
-            
+            control1 = args[0] + args[1] * 1j
+            control2 = args[2] + args[3] * 1j
+            end = args[4] + args[5] * 1j
+
             if not absolute:
                 control1 += current_pos
                 control2 += current_pos
                 end += current_pos
-                
+
             segments.append(path.CubicBezier(current_pos, control1, control2, end))
             current_pos = end
 
         elif command == 'S':
             # Smooth curve. First control point is the "reflection" of
             # the second control point in the previous path.
-            
-            if last_command not in 'CS':
+
+            if last_command not in ('C', 'S'):
                 # If there is no previous command or if the previous command
                 # was not an C, c, S or s, assume the first control point is
                 # coincident with the current point.
@@ -120,33 +149,33 @@ def parse_path(pathdef, current_pos=0j):
                 # the second control point on the previous command relative
                 # to the current point.
                 control1 = current_pos + current_pos - segments[-1].control2
-                
-            control2 = float(elements.pop()) + float(elements.pop()) * 1j
-            end = float(elements.pop()) + float(elements.pop()) * 1j
-            
+
+            control2 = args[0] + args[1] * 1j
+            end = args[2] + args[3] * 1j
+
             if not absolute:
                 control2 += current_pos
                 end += current_pos
-                
+
             segments.append(path.CubicBezier(current_pos, control1, control2, end))
             current_pos = end
 
         elif command == 'Q':
-            control = float(elements.pop()) + float(elements.pop()) * 1j
-            end = float(elements.pop()) + float(elements.pop()) * 1j
-            
+            control = args[0] + args[1] * 1j
+            end = args[2] + args[3] * 1j
+
             if not absolute:
                 control += current_pos
                 end += current_pos
-                
+
             segments.append(path.QuadraticBezier(current_pos, control, end))
             current_pos = end
 
         elif command == 'T':
             # Smooth curve. Control point is the "reflection" of
             # the second control point in the previous path.
-            
-            if last_command not in 'QT':
+
+            if last_command not in ('Q', 'T'):
                 # If there is no previous command or if the previous command
                 # was not an Q, q, T or t, assume the first control point is
                 # coincident with the current point.
@@ -156,29 +185,28 @@ def parse_path(pathdef, current_pos=0j):
                 # the control point on the previous command relative
                 # to the current point.
                 control = current_pos + current_pos - segments[-1].control2
-                
-            end = float(elements.pop()) + float(elements.pop()) * 1j
-            
+
+            end = args[0] + args[1] * 1j
+
             if not absolute:
-                control += current_pos
                 end += current_pos
-                
+
             segments.append(path.QuadraticBezier(current_pos, control, end))
             current_pos = end
 
         elif command == 'A':
-            radius = float(elements.pop()) + float(elements.pop()) * 1j
-            rotation = float(elements.pop())
-            arc = float(elements.pop())
-            sweep = float(elements.pop())            
-            end = float(elements.pop()) + float(elements.pop()) * 1j
-            
+            radius = args[0] + args[1] * 1j
+            rotation = args[2]
+            arc = args[3]
+            sweep = args[4]
+            end = args[5] + args[6] * 1j
+
             if not absolute:
                 end += current_pos
-                
+
             segments.append(path.Arc(current_pos, radius, rotation, arc, sweep, end))
             current_pos = end
-            
-    return segments
-    
-    
+
+    if packed:
+        return segments
+    return path.Path(*segments)
@@ -1,11 +1,137 @@
 from __future__ import division
-from math import sqrt, cos, sin, acos, degrees, radians
+from math import sqrt, cos, sin, acos, degrees, radians, log, ceil
+from array import array
+from bisect import bisect_left
 from collections import MutableSequence
 
 # This file contains classes for the different types of SVG path segments as
 # well as a Path object that contains a sequence of path segments.
 
+# Default absolute error (in user units) allowed for numerically integrated
+# segment lengths.
+ERROR = 1e-9
+
+# Bisections of the parameter range are capped so that rounding noise near the
+# requested error can't recurse forever.
+MAX_DEPTH = 30
+
+# Nodes and weights of the 5-point Gauss-Legendre rule on [-1, 1].
+_GAUSS_LEGENDRE = ((0.0, 0.5688888888888889),
+                   (-0.5384693101056831, 0.4786286704993665),
+                   (0.5384693101056831, 0.4786286704993665),
+                   (-0.9061798459386640, 0.2369268850561891),
+                   (0.9061798459386640, 0.2369268850561891))
+
+
+def _gauss_legendre(speeds, start, end):
+    half = (end - start) / 2
+    mid = (end + start) / 2
+    values = speeds([mid + half * x for x, _ in _GAUSS_LEGENDRE])
+    return half * sum(w * v for (_, w), v in zip(_GAUSS_LEGENDRE, values))
+
+
+def _adaptive_length(speeds, start, end, error, whole=None, depth=0):
+    """Integrate speeds over [start, end] with adaptive Gauss-Legendre
+    quadrature, halving the interval until both halves agree with the whole
+    to within error. speeds evaluates the speed at a list of positions."""
+    if whole is None:
+        whole = _gauss_legendre(speeds, start, end)
+    mid = (start + end) / 2
+    left = _gauss_legendre(speeds, start, mid)
+    right = _gauss_legendre(speeds, mid, end)
+    if depth >= MAX_DEPTH or abs(left + right - whole) <= error:
+        return left + right
+    return _adaptive_length(speeds, start, mid, error / 2, left, depth + 1) + \
+           _adaptive_length(speeds, mid, end, error / 2, right, depth + 1)
+
+
+# Newton iterations allowed when inverting arc length, and the number of
+# intervals in the length table that seeds them.
+MAX_NEWTON = 8
+LENGTH_TABLE_SIZE = 16
+
+
+def _length_table(segment):
+    """Cumulative lengths of segment at LENGTH_TABLE_SIZE + 1 evenly spaced
+    positions, for seeding arc length inversion."""
+    table = [0.0]
+    step = 1 / LENGTH_TABLE_SIZE
+    for i in range(LENGTH_TABLE_SIZE):
+        table.append(table[-1] + _adaptive_length(
+            segment._speeds, i * step, (i + 1) * step, ERROR / LENGTH_TABLE_SIZE))
+    return table
+
+
+def _arc_length_positions(segment, distances, table=None):
+    """The positions at which segment has covered each of the given
+    distances along it, found by Newton's method on the length table."""
+    table = table or _length_table(segment)
+    step = 1 / LENGTH_TABLE_SIZE
+    tolerance = ERROR * (1 + table[-1])
+    positions = []
+    for distance in distances:
+        i = min(max(bisect_left(table, distance) - 1, 0), LENGTH_TABLE_SIZE - 1)
+        low, high = i * step, (i + 1) * step
+        covered = table[i + 1] - table[i]
+        pos = low + step * ((distance - table[i]) / covered if covered > 0 else 0)
+        for _ in range(MAX_NEWTON):
+            speed = segment._speeds([pos])[0]
+            error = table[i] + _adaptive_length(
+                segment._speeds, low, pos, ERROR / LENGTH_TABLE_SIZE) - distance
+            if abs(error) <= tolerance or speed <= 0:
+                break
+            pos = min(max(pos - error / speed, low), high)
+        positions.append(pos)
+    return positions
+
+
+def _resample(segment, spacing):
+    table = _length_table(segment)
+    count = max(int(ceil(table[-1] / spacing)), 1)
+    distances = [table[-1] * i / count for i in range(1, count)]
+    positions = [0.0] + _arc_length_positions(segment, distances, table) + [1.0]
+    return segment.points(positions)
+
+
+def _chord_distance(point, start, end):
+    """Distance from point to the chord between start and end"""
+    chord = end - start
+    chord_sq = chord.real * chord.real + chord.imag * chord.imag
+    if chord_sq == 0:
+        return abs(point - start)
+    offset = point - start
+    t = (offset.real * chord.real + offset.imag * chord.imag) / chord_sq
+    return abs(offset - chord * min(max(t, 0.0), 1.0))
+
+
+def _flatten_bezier(controls, tolerance):
+    """Flatten a Bezier curve given by its control points into a polyline
+    whose chords are all within tolerance of the curve, by recursive de
+    Casteljau subdivision. Both end points are included."""
+    result = [controls[0]]
+    stack = [(controls, 0)]
+    while stack:
+        controls, depth = stack.pop()
+        start, end = controls[0], controls[-1]
+        # The curve lies in the hull of its control points, so it can't
+        # stray from the chord further than they do.
+        if depth >= MAX_DEPTH or max(_chord_distance(c, start, end)
+                                     for c in controls[1:-1]) <= tolerance:
+            result.append(end)
+            continue
+        left, right = [], []
+        while controls:
+            left.append(controls[0])
+            right.append(controls[-1])
+            controls = [(a + b) / 2 for a, b in zip(controls, controls[1:])]
+        right.reverse()
+        stack.append((right, depth + 1))
+        stack.append((left, depth + 1))
+    return result
+
+
 class Line(object):
+    __slots__ = ('start', 'end')
 
     def __init__(self, start, end):
         self.start = start
@@ -28,12 +154,31 @@ class Line(object):
         distance = self.end - self.start
         return self.start + distance * pos
 
-    def length(self):
+    def points(self, positions):
+        start = self.start
+        distance = self.end - start
+        return [start + distance * pos for pos in positions]
+
+    def length(self, error=ERROR):
         distance = (self.end - self.start)
         return sqrt(distance.real**2+distance.imag**2)
 
+    def _speeds(self, positions):
+        return [abs(self.end - self.start)] * len(positions)
+
+    def flatten(self, tolerance):
+        return [self.start, self.end]
+
+    def resample(self, spacing):
+        """Points evenly spaced along the line, no more than spacing apart,
+        from start to end"""
+        count = max(int(ceil(self.length() / spacing)), 1)
+        return self.points([i / count for i in range(count + 1)])
+
 
 class CubicBezier(object):
+    __slots__ = ('start', 'control1', 'control2', 'end')
+
     def __init__(self, start, control1, control2, end):
         self.start = start
         self.control1 = control1
@@ -62,32 +207,48 @@ class CubicBezier(object):
                (3 * (1-pos) * pos ** 2 * self.control2) + \
                (pos ** 3 * self.end)
 
-    def length(self):
-        """Calculate the length of the path up to a certain position"""
-        # Apparently it's impossible to integrate a Cubic Bezier, so
-        # this is a geometric approximation instead.
-
-        current_point = self.point(0)
-        # I needed 100,000 subdivisions to satisfy assertAlmostEqual on the
-        # Arc segment, so I go for the same here. Over 1,000,000 subdivisions
-        # makes no difference in accuracy at all.
-        subdivisions = 1000
-        lenght = 0
-        delta = 1/subdivisions
-
-        for x in range(1, subdivisions+1):
-            next_point = self.point(delta*x)
-            distance = sqrt((next_point.real - current_point.real)**2 + (next_point.imag - current_point.imag)**2)
-            lenght += distance
-            current_point = next_point
-
-        return lenght
+    def _coefficients(self):
+        """The curve as a polynomial in pos, constant term first"""
+        start, control1, control2, end = \
+            self.start, self.control1, self.control2, self.end
+        return (start,
+                3 * (control1 - start),
+                3 * (start - 2 * control1 + control2),
+                end - start + 3 * (control1 - control2))
+
+    def points(self, positions):
+        """Calculate the x,y positions at a list of positions of the path"""
+        c0, c1, c2, c3 = self._coefficients()
+        return [c0 + pos * (c1 + pos * (c2 + pos * c3)) for pos in positions]
+
+    def _speeds(self, positions):
+        """The magnitudes of the derivative at a list of positions"""
+        _, c1, c2, c3 = self._coefficients()
+        c2, c3 = 2 * c2, 3 * c3
+        return [abs(c1 + pos * (c2 + pos * c3)) for pos in positions]
+
+    def length(self, error=ERROR):
+        """Calculate the length of the path, to within error"""
+        # Apparently it's impossible to integrate a Cubic Bezier in closed
+        # form, so the speed is integrated numerically instead.
+        return _adaptive_length(self._speeds, 0.0, 1.0, error)
+
+    def flatten(self, tolerance):
+        """Approximate the path by a polyline no further than tolerance from
+        it, from start to end"""
+        return _flatten_bezier(
+            [self.start, self.control1, self.control2, self.end], tolerance)
+
+    def resample(self, spacing):
+        """Points evenly spaced by arc length along the curve, no more than
+        spacing apart, from start to end"""
+        return _resample(self, spacing)
 
 class QuadraticBezier(CubicBezier):
-    # For Quadratic Bezier we simply subclass the Cubic. This is less efficient
-    # and gives more complex calculations, but reuse means less bugs.
-    # It is possible to calculate the length of a quadratic bezier so a TODO is to
-    # replace the geometric approximation here.
+    # For Quadratic Bezier we simply subclass the Cubic for the bookkeeping.
+    # The curve itself is evaluated as a true quadratic, whose length has a
+    # closed form.
+    __slots__ = ()
 
     def __init__(self, start, control, end):
         self.start = start
@@ -98,8 +259,55 @@ class QuadraticBezier(CubicBezier):
         return '<QuadradicBezier start=%s control=%s end=%s>' % (
                self.start, self.control1, self.end)
 
+    def point(self, pos):
+        """Calculate the x,y position at a certain position of the path"""
+        return ((1-pos) ** 2 * self.start) + \
+               (2 * (1-pos) * pos * self.control1) + \
+               (pos ** 2 * self.end)
+
+    def _coefficients(self):
+        start, control, end = self.start, self.control1, self.end
+        return (start, 2 * (control - start), start - 2 * control + end, 0j)
+
+    def flatten(self, tolerance):
+        return _flatten_bezier([self.start, self.control1, self.end], tolerance)
+
+    def length(self, error=ERROR):
+        """Calculate the exact length of the path; error is ignored"""
+        # The derivative is 2 * a * pos + b, so the speed is the square root
+        # of the quadratic A * pos**2 + B * pos + C.
+        a = self.start - 2 * self.control1 + self.end
+        b = 2 * (self.control1 - self.start)
+        abs_a, abs_b = abs(a), abs(b)
+        a_dot_b = a.real * b.real + a.imag * b.imag
+
+        if abs_a <= 1e-12 * abs_b:
+            # Control point in the middle, this is a straight line.
+            return abs_b
+        if a_dot_b + abs_a * abs_b <= 1e-12 * abs_a * abs_b:
+            # Derivative is anti-parallel to its rate of change, so the curve
+            # runs along a line and may double back on itself.
+            k = abs_b / abs_a
+            if k >= 2:
+                return abs_b - abs_a
+            return abs_a * (k ** 2 / 2 - k + 1)
+
+        A = 4 * abs_a ** 2
+        B = 4 * a_dot_b
+        C = abs_b ** 2
+        sabc = 2 * sqrt(A + B + C)
+        a2 = sqrt(A)
+        a32 = 2 * A * a2
+        c2 = 2 * sqrt(C)
+        ba = B / a2
+        return (a32 * sabc + a2 * B * (sabc - c2) +
+                (4 * C * A - B ** 2) * log((2 * a2 + ba + sabc) / (ba + c2))) \
+               / (4 * a32)
+
 
 class Arc(object):
+    __slots__ = ('start', 'radius', 'rotation', 'arc', 'sweep', 'end',
+                 'center', 'theta', 'delta', '_theta', '_delta', '_u', '_v')
 
     def __init__(self, start, radius, rotation, arc, sweep, end):
         """radius is complex, rotation is in degrees,
@@ -176,7 +384,7 @@ class Arc(object):
         vy = (-y1prim - cyprim) / ry
         n = sqrt(ux * ux + uy * uy)
         p = ux
-        theta = degrees(acos(p / n))
+        theta = degrees(acos(min(max(p / n, -1.0), 1.0)))
         if uy < 0:
             theta = -theta
         self.theta = theta % 360
@@ -186,76 +394,134 @@ class Arc(object):
         if p == 0:
             delta = degrees(acos(0))
         else:
-            delta = degrees(acos(p / n))
+            delta = degrees(acos(min(max(p / n, -1.0), 1.0)))
         if (ux * vy - uy * vx) < 0:
             delta = -delta
         self.delta = delta % 360
         if not self.sweep:
             self.delta -= 360
 
-    def point(self, pos):
-        angle = radians(self.theta + (self.delta * pos))
-        cosr = cos(radians(self.rotation))
-        sinr = sin(radians(self.rotation))
-
-        x = cosr * cos(angle) * self.radius.real - sinr * sin(angle) * self.radius.imag + self.center.real
-        y = sinr * cos(angle) * self.radius.real + cosr * sin(angle) * self.radius.imag + self.center.imag
-        return complex(x, y)
+        # Everything point(), points() and length() need, in radians: the
+        # start and sweep angles and the rotated, scaled axes of the ellipse.
+        self._theta = radians(self.theta)
+        self._delta = radians(self.delta)
+        self._u = complex(cosr * self.radius.real, sinr * self.radius.real)
+        self._v = complex(-sinr * self.radius.imag, cosr * self.radius.imag)
 
-    def length(self):
+    def point(self, pos):
+        angle = self._theta + self._delta * pos
+        return self.center + self._u * cos(angle) + self._v * sin(angle)
+
+    def points(self, positions):
+        theta, delta = self._theta, self._delta
+        u, v, center = self._u, self._v, self.center
+        return [center + u * cos(angle) + v * sin(angle)
+                for angle in [theta + delta * pos for pos in positions]]
+
+    def _speeds(self, positions):
+        theta, delta = self._theta, self._delta
+        rx, ry = self.radius.real, self.radius.imag
+        return [abs(delta) * sqrt((rx * sin(angle)) ** 2 +
+                                  (ry * cos(angle)) ** 2)
+                for angle in [theta + delta * pos for pos in positions]]
+
+    def length(self, error=ERROR):
         """The length of an elliptical arc segment requires numerical
-        integration, and in that case it's simpler to just do a geometric
-        approximation, as for cubic bezier curves.
+        integration, the speed is integrated to within error.
         """
-
-        current_point = self.point(0)
-        # Here I need 100,000 subdivisions to satisfy assertAlmostEqual. It's
-        # a bit slow, but I'm not in a hurry. Over 1,000,000 subdivisions
-        # makes no difference in accuracy at all.
-        subdivisions = 100000
-        lenght = 0
-        delta = 1/subdivisions
-
-        for x in range(1, subdivisions+1):
-            next_point = self.point(delta*x)
-            distance = sqrt((next_point.real - current_point.real)**2 + (next_point.imag - current_point.imag)**2)
-            lenght += distance
-            current_point = next_point
-
-        return lenght
+        return _adaptive_length(self._speeds, 0.0, 1.0, error)
+
+    def flatten(self, tolerance):
+        """Approximate the arc by a polyline no further than tolerance from
+        it, from start to end"""
+        # A chord spanning an angle step deviates from the ellipse by at most
+        # the sagitta of a circle with the larger radius.
+        radius = max(abs(self.radius.real), abs(self.radius.imag))
+        if tolerance >= 2 * radius:
+            return [self.start, self.end]
+        step = 2 * acos(max(1 - tolerance / radius, -1.0))
+        count = max(int(ceil(abs(self._delta) / step)), 1)
+        return self.points([i / count for i in range(count + 1)])
+
+    def resample(self, spacing):
+        """Points evenly spaced by arc length along the arc, no more than
+        spacing apart, from start to end"""
+        return _resample(self, spacing)
 
 class Path(MutableSequence):
     """A Path is a sequence of path segments"""
 
     def __init__(self, *segments):
         self._segments = list(segments)
-        self._length = None
-        self._lengths = None
+        # Length of each segment, None until needed, and the cumulative
+        # length at the end of each segment for a prefix of the segments.
+        self._lengths = [None] * len(self._segments)
+        self._ends = []
+
+    def _forget_lengths(self, start):
+        """Drop the cumulative lengths from segment start onwards."""
+        del self._ends[start:]
+
+    def _slice_changed(self, index, old_length):
+        # Keep it simple: everything from the slice's first index is stale.
+        start, _, step = index.indices(old_length)
+        if step < 0:
+            start = 0
+        self._lengths = self._lengths[:start] + [None] * (len(self) - start)
+        self._forget_lengths(start)
+
+    def _check_index(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('path index out of range')
+        return index
 
     def __getitem__(self, index):
         return self._segments[index]
 
     def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            old_length = len(self)
+            self._segments[index] = value
+            self._slice_changed(index, old_length)
+            return
+        index = self._check_index(index)
         self._segments[index] = value
+        self._lengths[index] = None
+        self._forget_lengths(index)
 
     def __delitem__(self, index):
+        if isinstance(index, slice):
+            old_length = len(self)
+            del self._segments[index]
+            self._slice_changed(index, old_length)
+            return
+        index = self._check_index(index)
         del self._segments[index]
+        del self._lengths[index]
+        self._forget_lengths(index)
 
     def insert(self, index, value):
+        if index < 0:
+            index += len(self)
+        index = max(0, min(index, len(self)))
         self._segments.insert(index, value)
+        self._lengths.insert(index, None)
+        self._forget_lengths(index)
 
     def __len__(self):
         return len(self._segments)
 
     def __repr__(self):
-        return '<Path %s>' % ', '.join(repr(x) for x in self._segments)
+        return '<Path %s>' % ', '.join(repr(x) for x in self)
 
     def __eq__(self, other):
         if not isinstance(other, Path):
             return NotImplemented
         if len(self) != len(other):
             return False
-        for s, o in zip(self._segments, other._segments):
+        for s, o in zip(self, other):
             if not s == o:
                 return False
         return True
@@ -266,31 +532,215 @@ class Path(MutableSequence):
         return not self == other
 
     def _calc_lengths(self):
-        if self._length is not None:
-            return
-
-        lengths = [each.length() for each in self._segments]
-        self._length = sum(lengths)
-        self._lengths = [each/self._length for each in lengths]
+        """Extend the cumulative lengths to all segments, measuring only
+        the segments whose length isn't known yet."""
+        ends, lengths = self._ends, self._lengths
+        total = ends[-1] if ends else 0
+        for index in range(len(ends), len(self)):
+            if lengths[index] is None:
+                lengths[index] = self._segments[index].length()
+            total += lengths[index]
+            ends.append(total)
+        return ends
+
+    def _segment_pos(self, index, distance):
+        """The position on segment index which is distance along the path"""
+        ends = self._ends
+        segment_start = ends[index - 1] if index else 0
+        segment_length = ends[index] - segment_start
+        if segment_length <= 0:
+            return 1.0
+        # Accumulated errors may leave the end of the last segment short of
+        # the requested distance.
+        return min((distance - segment_start) / segment_length, 1.0)
 
     def point(self, pos):
-        self._calc_lengths()
+        ends = self._calc_lengths()
+        distance = pos * ends[-1]
         # Find which segment the point we search for is located on:
-        segment_start = 0
-        for index, segment in enumerate(self._segments):
-            segment_end = segment_start + self._lengths[index]
-            if segment_end >= pos:
-                # This is the segment! How far in on the segment is the point?
-                segment_pos = (pos - segment_start) / (segment_end - segment_start)
-                break
-            segment_start = segment_end
+        index = min(bisect_left(ends, distance), len(ends) - 1)
+        return self._segments[index].point(self._segment_pos(index, distance))
+
+    def points(self, positions):
+        """Calculate the x,y positions at a list of positions of the path.
+        The positions are visited in sorted order in a single walk over the
+        segments, and those falling on the same segment are evaluated
+        together.
+        """
+        positions = list(positions)
+        ends = self._calc_lengths()
+        total, last = ends[-1], len(ends) - 1
+        result = [None] * len(positions)
+
+        index = 0
+        run, slots = [], []
+        for slot in sorted(range(len(positions)), key=positions.__getitem__):
+            distance = positions[slot] * total
+            if index < last and ends[index] < distance:
+                if run:
+                    result_points = self._segments[index].points(run)
+                    for run_slot, point in zip(slots, result_points):
+                        result[run_slot] = point
+                    run, slots = [], []
+                while index < last and ends[index] < distance:
+                    index += 1
+            run.append(self._segment_pos(index, distance))
+            slots.append(slot)
+        if run:
+            for run_slot, point in zip(slots, self._segments[index].points(run)):
+                result[run_slot] = point
+
+        return result
+
+    def resample(self, spacing):
+        """Points evenly spaced by arc length along the whole path, no more
+        than spacing apart, from its start to its end. Corners between
+        segments are not preserved; resample segments to keep them."""
+        ends = self._calc_lengths()
+        if not ends:
+            return []
+        total = ends[-1]
+        count = max(int(ceil(total / spacing)), 1)
+
+        result = [self._segments[0].start]
+        index, distances = 0, []
+        for i in range(1, count + 1):
+            distance = total * i / count
+            while index < len(ends) - 1 and ends[index] < distance:
+                if distances:
+                    result.extend(self._resample_segment(index, distances))
+                    distances = []
+                index += 1
+            distances.append(distance - (ends[index - 1] if index else 0))
+        result.extend(self._resample_segment(index, distances))
+        return result
+
+    def _resample_segment(self, index, distances):
+        segment = self._segments[index]
+        return segment.points(_arc_length_positions(segment, distances))
+
+    def length(self):
+        ends = self._calc_lengths()
+        return ends[-1] if ends else 0
+
+
+class _PackedSegments(object):
+    """List-like storage for segments packed into flat arrays, a kind code
+    and eight doubles per segment, rather than as one object each. Segment
+    objects are created on access."""
+
+    # Kind codes; every segment is packed as four complex numbers:
+    #   Line: start, -, -, end
+    #   CubicBezier: start, control1, control2, end
+    #   QuadraticBezier: start, control, -, end
+    #   Arc: start, radius, rotation + (2 * arc + sweep) * 1j, end
+    LINE, CUBIC, QUADRATIC, ARC = range(4)
+
+    def __init__(self, segments=()):
+        self._kinds = array('B')
+        self._values = array('d')
+        for segment in segments:
+            self.append(segment)
+
+    def _pack(self, segment):
+        if isinstance(segment, Line):
+            kind, points = self.LINE, (segment.start, 0j, 0j, segment.end)
+        elif isinstance(segment, QuadraticBezier):
+            kind, points = self.QUADRATIC, (segment.start, segment.control1,
+                                            0j, segment.end)
+        elif isinstance(segment, CubicBezier):
+            kind, points = self.CUBIC, (segment.start, segment.control1,
+                                        segment.control2, segment.end)
+        elif isinstance(segment, Arc):
+            flags = 2 * segment.arc + segment.sweep
+            kind, points = self.ARC, (segment.start, segment.radius,
+                                      complex(segment.rotation, flags),
+                                      segment.end)
         else:
-            # This happens when pos is 1.0, and accumulated errors
-            # mean that segment_end of the last segment is not quite 1.0.
-            segment_pos = 1.0
+            raise TypeError('Cannot pack %r' % (segment,))
+        values = []
+        for point in points:
+            values.append(point.real)
+            values.append(point.imag)
+        return kind, values
+
+    def _unpack(self, index):
+        v = self._values[index * 8:index * 8 + 8]
+        start, a, b, end = (complex(v[0], v[1]), complex(v[2], v[3]),
+                            complex(v[4], v[5]), complex(v[6], v[7]))
+        kind = self._kinds[index]
+        if kind == self.LINE:
+            return Line(start, end)
+        elif kind == self.CUBIC:
+            return CubicBezier(start, a, b, end)
+        elif kind == self.QUADRATIC:
+            return QuadraticBezier(start, a, end)
+        flags = int(b.imag)
+        return Arc(start, a, b.real, flags & 2, flags & 1, end)
+
+    def _repack(self, segments):
+        self._kinds = array('B')
+        self._values = array('d')
+        for segment in segments:
+            self.append(segment)
+
+    def _check_index(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('path index out of range')
+        return index
 
-        return segment.point(segment_pos)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._unpack(self._check_index(index))
 
-    def length(self):
-        self._calc_lengths()
-        return self._length
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            segments = self[:]
+            segments[index] = value
+            self._repack(segments)
+            return
+        index = self._check_index(index)
+        kind, values = self._pack(value)
+        self._kinds[index] = kind
+        self._values[index * 8:index * 8 + 8] = array('d', values)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            segments = self[:]
+            del segments[index]
+            self._repack(segments)
+            return
+        index = self._check_index(index)
+        del self._kinds[index]
+        del self._values[index * 8:index * 8 + 8]
+
+    def insert(self, index, value):
+        kind, values = self._pack(value)
+        self._kinds.insert(index, kind)
+        self._values[index * 8:index * 8] = array('d', values)
+
+    def append(self, value):
+        kind, values = self._pack(value)
+        self._kinds.append(kind)
+        self._values.extend(values)
+
+    def __len__(self):
+        return len(self._kinds)
+
+
+class PackedPath(Path):
+    """A Path which stores its segments packed into flat arrays rather than
+    as one object each. Segment objects are created on access."""
+
+    def __init__(self, *segments):
+        Path.__init__(self)
+        self._segments = _PackedSegments(segments)
+        self._lengths = [None] * len(self._segments)
+
+    def append(self, value):
+        # Skips MutableSequence.append, which goes through insert.
+        self._segments.append(value)
+        self._lengths.append(None)
@@ -1,10 +1,32 @@
 #!/usr/bin/env python
 
 import argparse
+import base64
+import cache
+import collections
+import cProfile
+import cStringIO
+import game_level
+import gc
+import geometry
+import glob
 import itertools
+import json
+import level_binary
 import math
+import multiprocessing
+import os
+import profiling
 import re
+import SocketServer
+import spatial
+import stat
 import svg.path as svg
+import sys
+import tempfile
+import time
+import triangulation
+import validation
 import xml.etree.ElementTree as etree
 
 INKSCAPE_URI = "{http://www.inkscape.org/namespaces/inkscape}"
@@ -17,6 +39,9 @@ PATH_TAG = SVG_URI + 'path'
 RECT_TAG = SVG_URI + 'rect'
 IMAGE_TAG = SVG_URI + 'image'
 DESC_TAG = SVG_URI + 'desc'
+USE_TAG = SVG_URI + 'use'
+
+LEAF_TAGS = (PATH_TAG, RECT_TAG, IMAGE_TAG)
 
 LABEL_ATTR = INKSCAPE_URI + 'label'
 SODITYPE_ATTR = SODIPODI_URI + 'type'
@@ -26,6 +51,42 @@ RX_ATTR = SODIPODI_URI + 'rx'
 RY_ATTR = SODIPODI_URI + 'ry'
 LINK_ATTR = XLINK_URI + 'href'
 
+# Key of the table of prototypes of instances, with --use=table.
+PROTOTYPES_KEY = spatial.PROTOTYPES_KEY
+
+# The layer whose outlines cast shadows with --occluders.
+OCCLUDER_LAYER = 'collisions'
+
+# Options which change the generated level, and so are part of cache keys.
+CONVERSION_OPTIONS = ('refinement', 'flatten', 'tolerance', 'simplify',
+                      'simplify_tolerance', 'min_edge', 'scale', 'height',
+                      'units', 'schema', 'validate', 'use')
+
+# Options which only apply to the level as a whole once it is converted, so
+# are only part of the keys of cached files.
+OUTPUT_OPTIONS = ('format', 'compact', 'precision', 'index', 'cell_size',
+                  'split_long', 'triangulate', 'occluders')
+
+LUA_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+LUA_KEYWORDS = frozenset([
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for',
+    'function', 'if', 'in', 'local', 'nil', 'not', 'or', 'repeat', 'return',
+    'then', 'true', 'until', 'while'])
+LUA_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r',
+               '\t': '\\t'}
+
+def source_key():
+  # Cached results must not outlive changes to the converter itself.
+  here = os.path.dirname(os.path.abspath(__file__))
+  sources = sorted(glob.glob(os.path.join(here, '*.py')) +
+                   glob.glob(os.path.join(here, 'svg', 'path', '*.py')))
+  return cache.make_key(*(open(source, 'rb').read() for source in sources))
+
+SOURCE_KEY = source_key()
+
+def options_key(opts, names=CONVERSION_OPTIONS):
+  return tuple((name, opts[name]) for name in names)
+
 TRANSFORM_RE = re.compile(r'(\w+)\(([^\)]+)\)')
 TRANSFORM_ARGS_RE = re.compile(r'([-\d\.e]+)')
 
@@ -36,23 +97,34 @@ def parse_transform(transform_string):
     op, args = piece
     args = map(float, TRANSFORM_ARGS_RE.findall(args))
     if op == 'matrix': return args
-    if op == 'translate': return [1.0, 0.0, 0.0, 1.0, args[0], args[1]]
-    if op == 'scale': return [args[0], 0.0, 0.0, 0.0, args[1], 0.0]
+    if op == 'translate':
+      return [1.0, 0.0, 0.0, 1.0, args[0], args[1] if len(args) > 1 else 0.0]
+    if op == 'scale': return [args[0], 0.0, 0.0, args[-1], 0.0, 0.0]
     if op == 'rotate':
-      ca, sa = math.cos(args[0]), math.sin(args[0])
-      rotation = [ca, -sa, 0.0, sa, ca, 0.0]
+      ca, sa = math.cos(math.radians(args[0])), math.sin(math.radians(args[0]))
+      rotation = [ca, sa, -sa, ca, 0.0, 0.0]
       if len(args) == 3:
-        p = multiply_transforms(to_matrix('translate', args[1:2]), rotation)
-        p = multiply_transforms(p, to_matrix('translate', [-args[1], -args[2]]))
+        p = multiply_transforms([1.0, 0.0, 0.0, 1.0, args[1], args[2]], rotation)
+        p = multiply_transforms(p, [1.0, 0.0, 0.0, 1.0, -args[1], -args[2]])
         return p
       elif len(args) == 1:
         return rotation
       else:
         raise IOError(op + repr(args))
+    if op == 'skewX':
+      return [1.0, 0.0, math.tan(math.radians(args[0])), 1.0, 0.0, 0.0]
+    if op == 'skewY':
+      return [1.0, math.tan(math.radians(args[0])), 0.0, 1.0, 0.0, 0.0]
 
   transforms = itertools.imap(to_matrix, TRANSFORM_RE.findall(transform_string))
   return reduce(multiply_transforms, transforms)
 
+def invert_transform(t):
+  a, b, c, d, e, f = t
+  det = a * d - b * c
+  return [d / det, -b / det, -c / det, a / det,
+          (c * f - d * e) / det, (b * e - a * f) / det]
+
 def multiply_transforms(a, b):
   # [a0 a2 a4  [b0 b2 b4
   #  a1 a3 a5   b1 b3 b5
@@ -69,27 +141,101 @@ def transform_one(t, z):
   x, y = z.real, z.imag
   return (t[0] * x + t[2] * y + t[4]) + (t[1] * x + t[3] * y + t[5]) * 1j
 
-def transform_many(t, zs):
-  return itertools.imap(lambda z: transform_one(t, z), zs)
+def transform_points(t, zs):
+  """Apply t to all of zs at once. Written as z -> alpha z + beta conj(z) +
+  gamma, the transform is only a few complex operations per point."""
+  if not t: return list(zs)
+  a, b, c, d, e, f = t
+  alpha = complex(a + d, b - c) * .5
+  beta = complex(a - d, b + c) * .5
+  gamma = complex(e, f)
+  return [alpha * z + beta * z.conjugate() + gamma for z in zs]
+
+def to_coords(zs):
+  """Flatten points into a [x1, y1, x2, y2, ...] list."""
+  coords = [0.0] * (2 * len(zs))
+  coords[0::2] = [z.real for z in zs]
+  coords[1::2] = [z.imag for z in zs]
+  return coords
+
+def transform_ellipse(t, radius, rotation):
+  """The radii, as a complex number, and rotation in degrees of the ellipse
+  t maps an ellipse with the given ones to. The linear part of t times the
+  rotation and radii is decomposed as rotation(phi) * diag(sx, sy) *
+  rotation(theta), so that phi and |sx|, |sy| are the new ones."""
+  cos, sin = math.cos(math.radians(rotation)), \
+             math.sin(math.radians(rotation))
+  rx, ry = radius.real, radius.imag
+  a11 = (t[0] * cos + t[2] * sin) * rx
+  a12 = (t[2] * cos - t[0] * sin) * ry
+  a21 = (t[1] * cos + t[3] * sin) * rx
+  a22 = (t[3] * cos - t[1] * sin) * ry
+
+  e, f = (a11 + a22) * .5, (a11 - a22) * .5
+  g, h = (a21 + a12) * .5, (a21 - a12) * .5
+  q, r = math.hypot(e, h), math.hypot(f, g)
+  phi = (math.atan2(h, e) + math.atan2(g, f)) * .5
+  return complex(q + r, abs(q - r)), math.degrees(phi)
+
+def transform_arc(t, arc):
+  """The arc t maps arc to, with the ellipse t maps the arc's to."""
+  radius, rotation = transform_ellipse(t, arc.radius, arc.rotation)
+  start, end = transform_points(t, [arc.start, arc.end])
+  # A reflection reverses the direction in which the arc is swept.
+  sweep = arc.sweep != (t[0] * t[3] - t[1] * t[2] < 0)
+  return svg.Arc(start, radius, rotation, arc.arc, sweep, end)
+
+def transform_segment(t, segment):
+  if isinstance(segment, svg.Arc): return transform_arc(t, segment)
+  if isinstance(segment, svg.Line):
+    return svg.Line(*transform_points(t, [segment.start, segment.end]))
+  if isinstance(segment, svg.QuadraticBezier):
+    return svg.QuadraticBezier(*transform_points(
+        t, [segment.start, segment.control1, segment.end]))
+  return svg.CubicBezier(*transform_points(
+      t, [segment.start, segment.control1, segment.control2, segment.end]))
+
+def transform_path(t, path):
+  """The path t maps path to. Beziers transform exactly with their control
+  points, and arcs with their ellipse."""
+  return svg.Path(*[transform_segment(t, segment) for segment in path])
+
+def world_length(length, opts):
+  """A length given in opts['units'], in world units."""
+  if opts['units'] == 'world': return length
+  return finalize_scale(length, opts)
+
+def flatten_segment(segment, opts):
+  """Flatten a segment which is in world units."""
+  if opts['flatten'] == 'adaptive':
+    return segment.flatten(world_length(opts['tolerance'], opts))[:-1]
+  refinement = world_length(opts['refinement'], opts)
+  if opts['flatten'] == 'resample':
+    return segment.resample(refinement)[:-1]
+
+  with profiling.stage(opts.get('profile'), 'flatten/length'):
+    length = segment.length()
+  num_verts = int(length / refinement) + 1
+  step = 1.0 / num_verts
+  return segment.points([x * step for x in xrange(num_verts)])
 
 def path_to_polygon(path, opts):
   poly = []
-  refine = opts['refinement']
   for segment in path:
     if isinstance(segment, svg.Line):
       poly.append(segment.start)
     else:
-      num_verts = int(segment.length() / refine) + 1
-      step = 1.0 / num_verts
-      poly.extend((segment.point(x * step) for x in xrange(num_verts)))
+      poly.extend(flatten_segment(segment, opts))
 
   poly.append(path[-1].end)
 
+  # In world units y points up, and a polygon leaves its leftmost point
+  # towards the bottom, as it would go towards the top in the document.
   min_x = min(enumerate(poly), key = lambda x: x[1].real)
   for i in xrange(1, len(poly)):
     next_y = poly[(i + min_x[0]) % len(poly)].imag
-    if next_y > min_x[1].imag: break
-    elif next_y < min_x[1].imag: poly.reverse(); break
+    if next_y < min_x[1].imag: break
+    elif next_y > min_x[1].imag: poly.reverse(); break
 
   return poly
 
@@ -100,37 +246,94 @@ def rect_to_polygon(element, close):
   if close: poly.append(poly[0])
   return poly
 
-def finalize_coords(xy, opts):
+def simplify_polygon(poly, opts):
+  if opts['simplify'] == 'none': return poly
+
+  # The polygon is in world units, the tolerance is given in pixels.
+  tolerance = finalize_scale(opts['simplify_tolerance'], opts)
+  return geometry.simplify(poly, opts['simplify'], tolerance, opts['min_edge'])
+
+def finalize_transform(opts):
+  """The transform from document pixels to world units: y pointing up,
+  opts['scale'] units across and the origin in the middle of the document,
+  or, given opts['height'], that far above the bottom of the document."""
   dims = opts['dims']
-  xy = ((p - dims * .5).conjugate() / dims.real * opts['scale'] for p in xy)
-  return list(itertools.chain(*((x.real, x.imag) for x in xy)))
+  k = opts['scale'] / dims.real
+  if opts.get('height') is None: f = dims.imag * .5 * k
+  else: f = dims.imag * k - opts['height'] * .5
+  return [k, 0.0, 0.0, -k, -opts['scale'] * .5, f]
+
+def element_transform(transform, opts):
+  """An element's transform followed by the one to world units."""
+  return multiply_transforms(finalize_transform(opts), transform)
+
+def finalize_coords(xy, opts):
+  return to_coords(transform_points(finalize_transform(opts), xy))
 
 def finalize_scale(scale, opts):
   return scale / opts['dims'].real * opts['scale']
 
+def path_to_points(d, linear, opts):
+  """The polygon of the path d, transformed by the linear transform."""
+  profile = opts.get('profile')
+  entries = opts['cache']
+  if entries:
+    # Lengths in the options are in document pixels, which the width of the
+    # document sets the size of in the world.
+    key = cache.make_key('path', SOURCE_KEY, options_key(opts),
+                         finalize_scale(1.0, opts), linear, d)
+    with profiling.stage(profile, 'path cache'):
+      poly = entries.get(key)
+    if poly is not None: return poly
+
+  with profiling.stage(profile, 'parse_path'):
+    path = svg.parse_path(d)
+  if profile: profile.count_segments(len(path))
+  # Flatten in world units, so that vertices follow the size of the path in
+  # the level rather than in the group it was drawn in.
+  with profiling.stage(profile, 'transform'):
+    path = transform_path(linear, path)
+  with profiling.stage(profile, 'flatten'):
+    poly = path_to_polygon(path, opts)
+  with profiling.stage(profile, 'simplify'):
+    poly = simplify_polygon(poly, opts)
+  if entries: entries.put(key, poly)
+  return poly
+
+def path_to_coords(d, transform, opts):
+  # Flattening doesn't depend on where a path is, so copies and clones of a
+  # shape which only differ by a translation are flattened once.
+  t = element_transform(transform, opts)
+  linear, offset = t[:4] + [0.0, 0.0], complex(t[4], t[5])
+  memo = opts.get('memo')
+  key = (d, tuple(linear))
+  poly = memo.get(key) if memo is not None else None
+  if poly is None:
+    poly = path_to_points(d, linear, opts)
+    if memo is not None: memo[key] = poly
+  with profiling.stage(opts.get('profile'), 'transform'):
+    return to_coords([z + offset for z in poly])
+
 def link_to_subclass(link):
   subclass = link[link.rfind('/') + 1:]
   subclass = subclass[:subclass.find('.')]
   return subclass
 
-def parse_element(element, objects, transform, opts):
+def element_to_object(element, transform, opts):
+  """Convert a path, rect or image element, given its effective transform."""
+  profile = opts.get('profile')
+  if profile: profile.begin_element(element)
   obj = {}
-  transform = multiply_transforms(transform,
-                                  parse_transform(element.get('transform')))
-  if element.tag == GROUP_TAG:
-    for child in element:
-      parse_element(child, objects, transform, opts)
-    return
-
   if element.tag == PATH_TAG:
     if element.get(SODITYPE_ATTR) == 'arc':
       xy = float(element.get(CX_ATTR)) + float(element.get(CY_ATTR)) * 1j
       rx, ry = float(element.get(RX_ATTR)), float(element.get(RY_ATTR))
 
-      xy = transform_one(transform, xy)
       if transform:
-        rx *= transform[0]
-        ry *= transform[3]
+        # Rotations and reflections leave the radii positive.
+        radius, _ = transform_ellipse(transform, complex(rx, ry), 0.0)
+        rx, ry = radius.real, radius.imag
+      xy = transform_one(transform, xy)
       radius = (rx + ry) * .5
       if max(rx, ry) / min(rx, ry) > 1.05:
         print 'W: Ellipse ' + element.get('id') + ' (%f, %f) will be ' \
@@ -139,72 +342,1159 @@ def parse_element(element, objects, transform, opts):
       obj['circle'] = finalize_coords([xy], opts)
       obj['circle'].append(finalize_scale(radius, opts))
     else:
-      path = svg.parse_path(element.get('d'))
-      poly = transform_many(transform, path_to_polygon(path, opts))
-      obj['poly'] = finalize_coords(poly, opts)
+      obj['poly'] = path_to_coords(element.get('d'), transform, opts)
   elif element.tag == RECT_TAG or element.tag == IMAGE_TAG:
-    poly = transform_many(transform, rect_to_polygon(element, False))
-    obj['poly'] = finalize_coords(poly, opts)
+    obj['poly'] = to_coords(transform_points(
+        element_transform(transform, opts), rect_to_polygon(element, False)))
     link = element.get(LINK_ATTR)
     desc = element.find(DESC_TAG)
-    if link is not None: obj['subclass'] = link_to_subclass(link)
+    if link is not None and not link.startswith('data:'):
+      obj['subclass'] = link_to_subclass(link)
+      if opts['schema'] == 'game': obj['link'] = game_level.link_name(link)
     if desc is not None: obj['script'] = desc.text
 
-  if obj: objects.append(obj)
+  if profile: profile.end_element(obj)
+  return obj
+
+def validate_object(element, obj, opts):
+  """Check a path's polygon for what makes Box2D chains misbehave, and
+  report or, with --validate=repair, fix it. Returns the objects to use in
+  place of obj, since repairs can split a polygon."""
+  if opts['validate'] == 'none' or element.tag != PATH_TAG or \
+      'poly' not in obj:
+    return [obj]
+
+  with profiling.stage(opts.get('profile'), 'validate'):
+    coords = obj['poly']
+    points = [complex(x, y) for x, y in zip(coords[0::2], coords[1::2])]
+    problems = validation.validate(points, opts['min_edge'])
+    for problem, at in problems:
+      places = ', '.join('(%g, %g)' % (p.real, p.imag)
+                         for p in at[:VALIDATION_PLACES])
+      print 'W: Path %s: %s (%d) at %s%s.' % (
+          element.get('id'), problem, len(at), places,
+          '...' if len(at) > VALIDATION_PLACES else '')
+    if not problems or opts['validate'] != 'repair': return [obj]
+
+    pieces = validation.repair(points, opts['min_edge'])
+    print 'W: Path %s: repaired into %d polygon%s.' % (
+        element.get('id'), len(pieces), '' if len(pieces) == 1 else 's')
+    return [dict(obj, poly=to_coords(piece)) for piece in pieces]
+
+def element_to_objects(element, transform, opts):
+  obj = element_to_object(element, transform, opts)
+  if not obj: return []
+  return validate_object(element, obj, opts)
+
+def use_target(use):
+  href = use.get(LINK_ATTR) or use.get('href') or ''
+  return href[1:] if href.startswith('#') else None
+
+def use_offset(use):
+  return [1.0, 0.0, 0.0, 1.0, float(use.get('x', 0)), float(use.get('y', 0))]
+
+class UnresolvedUse(Exception):
+  """A use could not be expanded since the prototype it refers to, or that
+  of a use within it, does not exist or contains the use."""
+
+  def __init__(self, target, cycle):
+    Exception.__init__(self, target)
+    self.target = target
+    self.cycle = cycle
+
+def expand_use(use, prototypes, expanding=frozenset()):
+  """A group which places the prototype use refers to where use does. Uses
+  within the prototype, or the prototype itself if it is a use, are
+  expanded as well; expanding holds the ids of the prototypes being
+  expanded, which would not end. Raises UnresolvedUse."""
+  target = use_target(use)
+  prototype = prototypes.get(target)
+  if prototype is None or target in expanding:
+    raise UnresolvedUse(target, prototype is not None)
+  expanding = expanding | frozenset([target])
+  if prototype.tag == USE_TAG:
+    prototype = expand_use(prototype, prototypes, expanding)
+  else:
+    expand_uses(prototype, prototypes, expanding)
+
+  transform = multiply_transforms(parse_transform(use.get('transform')),
+                                  use_offset(use))
+  group = etree.Element(GROUP_TAG)
+  group.set('transform', 'matrix(%r, %r, %r, %r, %r, %r)' % tuple(transform))
+  group.append(prototype)
+  return group
+
+def expand_uses(element, prototypes, expanding=frozenset()):
+  """Replace the uses within element with their expand_use groups."""
+  for parent in list(element.iter()):
+    for child in list(parent):
+      if child.tag == USE_TAG:
+        replace_child(parent, child,
+                      expand_use(child, prototypes, expanding))
+
+def replace_child(parent, child, replacement):
+  children = list(parent)
+  if child in children: parent[children.index(child)] = replacement
+
+def use_to_instance(use, transform, opts):
+  """An instance of the prototype use refers to, given the use's effective
+  transform: the prototype's id and the transform from the prototype in
+  world units, as it is written under PROTOTYPES_KEY, to the instance."""
+  finalize = finalize_transform(opts)
+  placement = multiply_transforms(transform, use_offset(use))
+  return {'use': use_target(use), 'transform': multiply_transforms(
+      multiply_transforms(finalize, placement), invert_transform(finalize))}
 
-def parse_svg(filename, opts):
-  tree = etree.parse(filename)
-  root = tree.getroot()
-  width = float(root.get('width'))
-  height = float(root.get('height'))
-  opts['dims'] = width + height * 1j
+def shared_path_id(d):
+  return 'path-' + cache.make_key(d)[:12]
+
+def leaf_to_objects(element, transform, opts):
+  """Convert a leaf, given its effective transform. With --use=table, uses
+  and paths with the same data as others become instances."""
+  if element.tag == USE_TAG:
+    # Uses to expand are replaced with their prototype before conversion,
+    # those left could not be resolved.
+    if opts['use'] != 'table': return []
+    return [use_to_instance(element, transform, opts)]
+  d = element.get('d')
+  if element.tag == PATH_TAG and element.get(SODITYPE_ATTR) != 'arc' and \
+      opts['use'] == 'table' and shared_path_id(d) in opts['shared_paths']:
+    # Placed like a use of the path with no transform.
+    use = etree.Element(USE_TAG, {LINK_ATTR: '#' + shared_path_id(d)})
+    return [use_to_instance(use, transform, opts)]
+  return element_to_objects(element, transform, opts)
+
+def parse_element(element, objects, transform, opts):
+  transform = multiply_transforms(transform,
+                                  parse_transform(element.get('transform')))
+  if element.tag == GROUP_TAG:
+    for child in element:
+      parse_element(child, objects, transform, opts)
+    return
 
-  level = {}
-  for layer_element in root.findall(GROUP_TAG):
-    name = layer_element.get(LABEL_ATTR).lower()
-    if name[0] == '#': continue
+  objects.extend(leaf_to_objects(element, transform, opts))
 
+def prototypes_table(ids, prototypes, opts):
+  """Convert the prototypes with the given ids, and those of the instances
+  in them, for --use=table."""
+  table, seen = {}, set()
+  pending = sorted(ids)
+  while pending:
+    id = pending.pop()
+    if id in seen: continue
+    seen.add(id)
+    if id in opts['shared_paths']:
+      path = etree.Element(PATH_TAG, id=id, d=opts['shared_paths'][id])
+      table[id] = element_to_objects(path, None, opts)
+      continue
+    if id not in prototypes:
+      print 'W: Clones refer to #%s, which does not exist.' % id
+      continue
     objects = []
-    transform = parse_transform(layer_element.get('transform'))
-    for child in layer_element: parse_element(child, objects, transform, opts)
-    level[name] = objects
+    parse_element(prototypes[id], objects, None, opts)
+    table[id] = objects
+    pending.extend(obj['use'] for obj in objects if 'use' in obj)
+  return table
+
+def drop_broken_instances(level):
+  """Drop the instances of prototypes which do not exist, or which contain
+  instances of themselves or of such prototypes, as --use=expand would."""
+  table = level[PROTOTYPES_KEY]
+  placeable = {}
+  def check(id):
+    if id not in placeable:
+      # Left None while the prototype's own objects are checked.
+      placeable[id] = None
+      placeable[id] = id in table and all(
+          check(obj['use']) for obj in table[id] if 'use' in obj)
+    elif placeable[id] is None:
+      print 'W: Clones refer to #%s, which contains them.' % id
+      return False
+    return placeable[id]
+
+  dropped = dict((name, [obj for obj in objects
+                         if 'use' not in obj or check(obj['use'])])
+                 for name, objects in level.iteritems()
+                 if name != PROTOTYPES_KEY)
+  dropped[PROTOTYPES_KEY] = dict((id, objects)
+                                 for id, objects in table.iteritems()
+                                 if check(id))
+  return dropped
+
+def parse_layer(layer_element, opts):
+  objects = []
+  transform = parse_transform(layer_element.get('transform'))
+  for child in layer_element: parse_element(child, objects, transform, opts)
+  return objects
+
+def parse_layer_xml(job):
+  # Pool workers receive layers serialized, elements don't pickle. What they
+  # print is returned, to be printed where the document is converted.
+  xml, opts = job
+  stdout, sys.stdout = sys.stdout, cStringIO.StringIO()
+  try:
+    return parse_layer(etree.fromstring(xml), opts), sys.stdout.getvalue()
+  finally:
+    sys.stdout = stdout
+
+def parse_layer_cached(layer_element, opts, layer_cache):
+  key = cache.make_key('layer', SOURCE_KEY, options_key(opts), opts['dims'],
+                       sorted(opts['shared_paths']),
+                       etree.tostring(layer_element))
+  objects = layer_cache.get(key)
+  if objects is None:
+    objects = parse_layer(layer_element, opts)
+    layer_cache.put(key, objects)
+  return objects
+
+# Number of places listed for each kind of problem found by validation.
+VALIDATION_PLACES = 3
+
+# iterparse reads 16 KB at a time and expat rescans an unfinished token on
+# every read, which is quadratic in the size of embedded base64 images.
+READ_SIZE = 4 * 1024 * 1024
+
+class ChunkedReader(object):
+  def __init__(self, f, size):
+    self.f = f
+    self.size = size
+
+  def read(self, size):
+    return self.f.read(max(size, self.size))
+
+# Objects of a layer which go before its position-th object.
+DeferredObjects = collections.namedtuple('DeferredObjects',
+                                         ['position', 'objects'])
+
+def scan_svg(source, opts):
+  """Read the SVG document source through for the ids use elements refer
+  to and, with --use=table, the data of paths which appear more than once,
+  by the id of their prototype. Elements are dropped as they are read."""
+  referenced, counts, shared = set(), collections.Counter(), {}
+  elements = []
+  events = profiling.timed_iter(opts.get('profile'), 'xml',
+      etree.iterparse(ChunkedReader(source, READ_SIZE),
+                      events=('start', 'end')))
+  for event, element in events:
+    if event == 'start':
+      elements.append(element)
+      continue
+    elements.pop()
+    if element.tag == USE_TAG:
+      referenced.add(use_target(element))
+    elif element.tag == PATH_TAG and opts['use'] == 'table' and \
+        element.get(SODITYPE_ATTR) != 'arc' and element.get('d') is not None:
+      id = shared_path_id(element.get('d'))
+      counts[id] += 1
+      if counts[id] == 2: shared[id] = element.get('d')
+    if elements: del elements[-1][-1]
+  return frozenset(referenced), shared
+
+def iter_svg(source, opts, whole_layers=False):
+  """Stream an SVG document while it is read. Yields (name, None) when a
+  layer starts, then (name, obj) for each of the layer's objects as soon as
+  its element has been read. With whole_layers, (name, element) is yielded
+  once for each complete layer element instead. Elements are dropped once
+  they have been converted, so memory use doesn't grow with the document.
 
+  Elements which use elements refer to are kept as prototypes. With
+  --use=expand each use is replaced with its prototype; those referring
+  forward, and whole layers holding them, are only yielded at the end of the
+  document; the objects of such uses as a DeferredObjects, with the number
+  of objects of the layer yielded before the use. With --use=table, (PROTOTYPES_KEY, table) is yielded last, the
+  converted prototypes by id.
+
+  Sets opts['dims'] from the root element."""
+  if isinstance(source, basestring):
+    with open(source, 'rb') as f:
+      for item in iter_svg(f, opts, whole_layers): yield item
+    return
+
+  # Prototypes must outlive the rest of the document, so the ids used are
+  # found in a first pass over it.
+  try:
+    start = source.tell()
+  except (AttributeError, IOError):
+    # Such as a pipe, which can only be read once.
+    source = cStringIO.StringIO(source.read())
+    start = 0
+  referenced, opts['shared_paths'] = scan_svg(source, opts)
+  # The parser is left in reference cycles, holding a buffer as large as the
+  # largest element read, such as an embedded image. Free it before the
+  # second pass grows another.
+  gc.collect()
+  source.seek(start)
+  prototypes, deferred, held, used = {}, [], [], set()
+  # Objects yielded so far by layer, where deferred objects go.
+  positions = collections.Counter()
+  keeping = 0
+
+  elements, transforms = [], []
+  name = None
+  opts['memo'] = {}
+  events = profiling.timed_iter(opts.get('profile'), 'xml',
+      etree.iterparse(ChunkedReader(source, READ_SIZE),
+                      events=('start', 'end')))
+  for event, element in events:
+    if event == 'start':
+      if not elements:
+        width = float(element.get('width'))
+        height = float(element.get('height'))
+        opts['dims'] = width + height * 1j
+        transforms.append(None)
+      else:
+        if len(elements) == 1:
+          name = None
+          if element.tag == GROUP_TAG:
+            label = element.get(LABEL_ATTR).lower()
+            if label[0] != '#':
+              name = label
+              positions[name] = 0
+              yield name, None
+        transforms.append(multiply_transforms(
+            transforms[-1], parse_transform(element.get('transform'))))
+      if element.get('id') in referenced: keeping += 1
+      elements.append(element)
+      continue
+
+    elements.pop()
+    transform = transforms.pop()
+    if element.get('id') in referenced:
+      prototypes[element.get('id')] = element
+      keeping -= 1
+    if not elements: break
+
+    parent = elements[-1]
+    in_layer = name is not None and len(elements) > 1
+    instance = element
+    if element.tag == USE_TAG:
+      target = use_target(element)
+      if in_layer: used.add(target)
+      if opts['use'] == 'expand':
+        try:
+          instance = expand_use(element, prototypes)
+          replace_child(parent, element, instance)
+        except UnresolvedUse:
+          # Most likely a prototype further on, which is tried again at the
+          # end of the document.
+          instance = None
+          deferred.append((element, parent, transforms[-1],
+                           name if in_layer else None,
+                           elements[1] if in_layer else None,
+                           positions[name]))
+
+    if name is not None and whole_layers and len(elements) == 1:
+      if any(layer is element for _, _, _, _, layer, _ in deferred):
+        held.append((name, element))
+      else:
+        yield name, element
+    elif in_layer and not whole_layers and element.tag in LEAF_TAGS:
+      for obj in leaf_to_objects(element, transform, opts):
+        if 'use' in obj: used.add(obj['use'])
+        positions[name] += 1
+        yield name, obj
+    elif in_layer and not whole_layers and instance is not None and \
+        element.tag == USE_TAG:
+      objects = []
+      parse_element(instance, objects, transforms[-1], opts)
+      positions[name] += len(objects)
+      for obj in objects: yield name, obj
+
+    # An element is the last child of its parent when it ends. Descriptions
+    # go with their image, whole layers are kept until they end and
+    # prototypes for good.
+    if parent.tag not in LEAF_TAGS and not (in_layer and whole_layers) and \
+        not keeping:
+      del parent[-1]
+
+  for use, parent, transform, layer_name, layer, position in deferred:
+    try:
+      group = expand_use(use, prototypes)
+    except UnresolvedUse as e:
+      print 'W: Clone %s refers to #%s, which %s.' % (
+          use.get('id'), e.target,
+          'contains it' if e.cycle else 'does not exist')
+      continue
+    replace_child(parent, use, group)
+    if layer_name is not None and not whole_layers:
+      objects = []
+      parse_element(group, objects, transform, opts)
+      yield layer_name, DeferredObjects(position, objects)
+
+  for item in held: yield item
+  if opts['use'] == 'table':
+    # Layers converted whole are converted elsewhere, so all shared paths
+    # are taken to be used.
+    if whole_layers: used.update(opts['shared_paths'])
+    if used: yield PROTOTYPES_KEY, prototypes_table(used, prototypes, opts)
+
+def parse_svg(source, opts, pool=None, layer_cache=None):
+  level, pending, deferred = {}, [], []
+  whole_layers = pool is not None or layer_cache is not None
+  for name, item in iter_svg(source, opts, whole_layers):
+    if name == PROTOTYPES_KEY:
+      level[name] = item
+    elif isinstance(item, DeferredObjects):
+      deferred.append((name, item))
+    elif item is None:
+      level[name] = []
+    elif pool:
+      pending.append((name, pool.apply_async(
+          parse_layer_xml, [(etree.tostring(item), opts)])))
+    elif layer_cache:
+      level[name] = parse_layer_cached(item, opts, layer_cache)
+    else:
+      level[name].append(item)
+
+  for name, result in pending:
+    level[name], printed = result.get()
+    sys.stdout.write(printed)
+  # Last first, so that the positions of the others still hold.
+  for name, item in reversed(deferred):
+    level[name][item.position:item.position] = item.objects
+  if PROTOTYPES_KEY in level: level = drop_broken_instances(level)
   return level
 
-def to_lua(obj, depth):
+def index_level(level, opts):
+  if opts['index'] == 'none': return level
+  return spatial.index_level(level, opts['index'], opts['cell_size'],
+                             opts['split_long'])
+
+def coords_to_points(coords):
+  return [complex(x, y) for x, y in zip(coords[0::2], coords[1::2])]
+
+def triangulate_coords(coords, what, opts):
+  with profiling.stage(opts.get('profile'), 'finish/triangulate'):
+    points = coords_to_points(coords)
+    triangles, forced = triangulation.triangulate(points)
+    # Ear clipping can go through some polygons whose edges cross without
+    # forcing an ear, so those are looked for as well.
+    ring = validation.remove_duplicates(points + points[:1])
+    crossed = forced or validation.crossings(ring)
+  if crossed:
+    print 'W: %s is not a simple polygon, its triangles may overlap.' % what
+  return triangles
+
+def triangulate_objects(objects, what, opts):
+  """Copies of objects with the index buffer of their triangles added to
+  polygons. Images and scripted objects are entities placed by the game
+  rather than geometry, and are left unfilled. Instances which mirror their
+  prototype, and so its triangles, are marked reflected."""
+  result = []
+  for number, obj in enumerate(objects, 1):
+    if 'use' in obj:
+      t = obj['transform']
+      result.append(dict(obj, reflected=True) if t[0] * t[3] < t[1] * t[2]
+                    else obj)
+    elif 'poly' not in obj or 'subclass' in obj or 'script' in obj:
+      result.append(obj)
+    else:
+      result.append(dict(obj, triangles=triangulate_coords(
+          obj['poly'], 'Object %d of %s' % (number, what), opts)))
+  return result
+
+def triangulate_level(level, opts):
+  triangulated = {}
+  for name, objects in level.iteritems():
+    if name == PROTOTYPES_KEY:
+      triangulated[name] = dict(
+          (id, triangulate_objects(prototype, 'prototype ' + id, opts))
+          for id, prototype in objects.iteritems())
+    else:
+      triangulated[name] = triangulate_objects(objects, 'layer ' + name, opts)
+  return triangulated
+
+def outlines(objects, prototypes, spacing, transform=None):
+  """The outlines of objects as lists of points, with circles as polygons
+  with vertices about spacing apart and instances as the outlines of their
+  prototypes, placed."""
+  for obj in objects:
+    if 'use' in obj:
+      placement = multiply_transforms(transform, obj['transform'])
+      for outline in outlines(prototypes.get(obj['use'], ()), prototypes,
+                              spacing, placement):
+        yield outline
+      continue
+    if 'circle' in obj:
+      coords = game_level.circle_to_chain(obj['circle'], spacing)
+    else:
+      coords = obj.get('poly')
+    if coords: yield transform_points(transform, coords_to_points(coords))
+
+def occluders(chains, opts):
+  """The occluder grid of chains of complex points, see spatial.py."""
+  with profiling.stage(opts.get('profile'), 'finish/occluders'):
+    return spatial.occluder_grid([[(p.real, p.imag) for p in chain]
+                                  for chain in chains], opts['cell_size'])
+
+def finish_level(level, opts):
+  """The level as it is written out, in the schema given by opts."""
+  spacing = world_length(opts['refinement'], opts)
+  if opts['schema'] == 'game':
+    game = game_level.to_game_level(level, spacing, opts['scale'])
+    if opts['triangulate']:
+      game['CollisionTriangles'] = [
+          triangulate_coords(chain, 'Collision %d' % number, opts)
+          for number, chain in enumerate(game['Collisions'], 1)]
+    if opts['occluders']:
+      game['Occluders'] = occluders(
+          map(coords_to_points, game['Collisions']), opts)
+    return game
+
+  if opts['triangulate']: level = triangulate_level(level, opts)
+  if opts['occluders']:
+    level = dict(level, _occluders=occluders(
+        outlines(level.get(OCCLUDER_LAYER, ()),
+                 level.get(PROTOTYPES_KEY, {}), spacing), opts))
+  return index_level(level, opts)
+
+def lua_string(text):
+  if isinstance(text, unicode): text = text.encode('utf-8')
+  return '"' + ''.join(
+      LUA_ESCAPES.get(c) or (c if ' ' <= c < '\x7f' or c >= '\x80'
+                             else '\\%03d' % ord(c))
+      for c in text) + '"'
+
+def lua_number(x, precision=None):
+  if isinstance(x, bool): return 'true' if x else 'false'
+  if isinstance(x, (int, long)): return str(x)
+  if x != x: return '0/0'
+  if x in (float('inf'), float('-inf')): return '1/0' if x > 0 else '-1/0'
+  return repr(x if precision is None else round(x, precision))
+
+def lua_numbers(xs, precision=None, separator=', '):
+  """The numbers xs as a separated list of Lua literals."""
+  if all(type(x) is float for x in xs):
+    if precision is not None: xs = [round(x, precision) for x in xs]
+    text = separator.join(map(repr, xs))
+    # Only inf and nan, which are not Lua literals, contain an 'n'.
+    if 'n' not in text: return text
+  return separator.join(lua_number(x, precision) for x in xs)
+
+def lua_key(key):
+  if isinstance(key, (int, long)): return '[%d]' % key
+  if LUA_IDENTIFIER_RE.match(key) and key not in LUA_KEYWORDS: return key
+  return '[' + lua_string(key) + ']'
+
+def write_lua(obj, out, depth=0, compact=False, precision=None):
+  """Write obj to the file object out as a Lua expression. Tables are
+  indented one item per line, except lists of numbers in compact mode which
+  go on a single line. Numbers are rounded to precision decimal places."""
+  if isinstance(obj, basestring):
+    out.write(lua_string(obj))
+    return
+  elif obj is None:
+    out.write('nil')
+    return
+  elif not isinstance(obj, (dict, list)):
+    out.write(lua_number(obj, precision))
+    return
+  elif not obj:
+    out.write('{}')
+    return
+
   prefix = '  ' * depth
   prefixPlus = '  ' * (depth + 1)
-  if isinstance(obj, list):
-    return '{\n' + prefixPlus + (',\n' + prefixPlus).join( \
-        itertools.imap(lambda x: to_lua(x, depth + 1) , obj)) + '\n' + prefix + '}'
-  elif isinstance(obj, dict):
-    return '{\n' + prefixPlus + (',\n' + prefixPlus).join( \
-        (k + ' = ' + to_lua(v, depth + 1) for (k, v) in obj.iteritems())) + \
-        '\n' + prefix + '}'
+  if isinstance(obj, dict):
+    items = [(lua_key(k) + ' = ', v) for k, v in sorted(obj.iteritems())]
+  elif all(isinstance(x, (int, long, float)) for x in obj):
+    if compact:
+      out.write('{' + lua_numbers(obj, precision) + '}')
+    else:
+      out.write('{\n' + prefixPlus +
+                lua_numbers(obj, precision, ',\n' + prefixPlus) +
+                '\n' + prefix + '}')
+    return
   else:
-    return repr(obj)
+    items = [('', v) for v in obj]
 
-def level_to_lua(level):
-  return 'return ' + to_lua(level, 0)
+  out.write('{\n')
+  for i, (key, value) in enumerate(items):
+    out.write((',\n' if i else '') + prefixPlus + key)
+    write_lua(value, out, depth + 1, compact, precision)
+  out.write('\n' + prefix + '}')
 
-if __name__ == '__main__':
+def level_to_lua(level, compact=False, precision=None):
+  out = cStringIO.StringIO()
+  out.write('return ')
+  write_lua(level, out, 0, compact, precision)
+  return out.getvalue()
+
+def write_level(level, out, opts):
+  if opts['format'] == 'binary':
+    out.write(level_binary.dumps(level))
+    return
+  out.write('return ')
+  write_lua(level, out, 0, opts['compact'], opts['precision'])
+  out.write('\n')
+
+def level_to_output(level, opts):
+  out = cStringIO.StringIO()
+  write_level(level, out, opts)
+  return out.getvalue()
+
+def find_inputs(patterns):
+  filenames = []
+  for pattern in patterns:
+    if os.path.isdir(pattern):
+      matches = sorted(glob.glob(os.path.join(pattern, '*.svg')))
+    elif os.path.exists(pattern):
+      matches = [pattern]
+    else:
+      # Unmatched names are kept so that they get reported as failures.
+      matches = sorted(glob.glob(pattern)) or [pattern]
+    filenames.extend(os.path.normpath(f) for f in matches
+                     if os.path.normpath(f) not in filenames)
+  return filenames
+
+def output_filename(filename, opts):
+  name = os.path.splitext(os.path.basename(filename))[0]
+  return os.path.join(opts['output_dir'], opts['output'].format(name=name))
+
+def make_output_dir(filename):
+  """Create the directory the output file filename goes in, if missing."""
+  directory = os.path.dirname(filename)
+  if not directory or os.path.isdir(directory): return
+  try:
+    os.makedirs(directory)
+  except OSError:
+    # Another job may have just created it.
+    if not os.path.isdir(directory): raise
+
+def write_atomically(filename, write):
+  """Call write with a file object whose contents replace filename once it
+  returns, so that readers such as a running game only see complete files."""
+  handle, temp = tempfile.mkstemp(dir=os.path.dirname(filename) or '.',
+                                  prefix='.' + os.path.basename(filename))
+  try:
+    with os.fdopen(handle, 'wb') as f: write(f)
+  except:
+    os.remove(temp)
+    raise
+  umask = os.umask(0)
+  os.umask(umask)
+  os.chmod(temp, 0666 & ~umask)
+  os.rename(temp, filename)
+
+def document_key(data, opts):
+  """The cache key of the output of the document whose bytes are data."""
+  return cache.make_key('file', SOURCE_KEY, options_key(opts),
+                        options_key(opts, OUTPUT_OPTIONS), data)
+
+def messages_key(key):
+  """The cache key of what was printed while converting the output cached at
+  key, so that warnings are printed again when it is reused."""
+  return cache.make_key('messages', key)
+
+class Recorder(object):
+  """A file object which writes to out and keeps what it wrote, to stand in
+  for sys.stdout while a document is converted."""
+
+  def __init__(self, out):
+    self.out = out
+    self.text = cStringIO.StringIO()
+
+  def write(self, text):
+    self.text.write(text)
+    self.out.write(text)
+
+  def flush(self):
+    self.out.flush()
+
+  def getvalue(self):
+    return self.text.getvalue()
+
+def convert_file(filename, opts, pool=None):
+  """Convert filename, returning the output file name and whether the result
+  came from the cache."""
+  opts = dict(opts)
+  profile = opts.get('profile')
+  if profile: profile.filename = filename
+  output = output_filename(filename, opts)
+  # Before anything is converted or cached, so that an output which cannot
+  # be written does not leave a cache entry behind.
+  make_output_dir(output)
+  text, messages, key = None, None, None
+  if opts['cache']:
+    with open(filename, 'rb') as f: key = document_key(f.read(), opts)
+    with profiling.stage(profile, 'file cache'):
+      text = opts['cache'].get(key)
+      messages = opts['cache'].get(messages_key(key))
+
+  cached = text is not None and messages is not None
+  if cached:
+    # The warnings of the conversion the output came from.
+    sys.stdout.write(messages)
+  else:
+    # What is printed is cached with the output.
+    recorder = Recorder(sys.stdout)
+    sys.stdout = recorder
+    try:
+      level = parse_svg(filename, opts, pool)
+      with profiling.stage(profile, 'finish'):
+        level = finish_level(level, opts)
+    finally:
+      sys.stdout = recorder.out
+    if not key:
+      with profiling.stage(profile, 'write'):
+        write_atomically(output, lambda f: write_level(level, f, opts))
+      return output, cached
+    with profiling.stage(profile, 'write'):
+      text = level_to_output(level, opts)
+    opts['cache'].put(key, text)
+    opts['cache'].put(messages_key(key), recorder.getvalue())
+
+  write_atomically(output, lambda f: f.write(text))
+  return output, cached
+
+def convert_job(job):
+  filename, opts = job[:2]
+  pool = job[2] if len(job) > 2 else None
+  start = time.time()
+  try:
+    output, cached = convert_file(filename, opts, pool)
+    return filename, output, cached, time.time() - start, None
+  except Exception as e:
+    return filename, None, False, time.time() - start, '%s: %s' % (
+        type(e).__name__, e)
+
+def watch(filenames, opts, interval, top=10):
+  """Reconvert files whenever they change, until interrupted. Layers and
+  paths are kept in memory between conversions so that only the ones that
+  changed are converted again."""
+  layer_cache = cache.MemoryCache(max_entries=1024)
+  opts = dict(opts, cache=cache.MemoryCache(opts['cache']))
+  stamps = {}
+  while True:
+    for filename in filenames:
+      try:
+        stat = os.stat(filename)
+      except OSError:
+        continue
+      stamp = (stat.st_mtime, stat.st_size)
+      if stamps.get(filename) == stamp: continue
+      stamps[filename] = stamp
+
+      start = time.time()
+      try:
+        output = output_filename(filename, opts)
+        make_output_dir(output)
+        with open(filename, 'rb') as f:
+          level = convert_level(f, opts, layer_cache)
+        write_atomically(output, lambda f: write_level(level, f, opts))
+        print '%s -> %s (%.3f s)' % (filename, output, time.time() - start)
+        if opts['profile']:
+          opts['profile'].report(sys.stdout, top)
+          opts['profile'] = profiling.Profile()
+      except Exception as e:
+        # Most likely caught the file mid-save, the next save retries.
+        print 'E: %s: %s: %s' % (filename, type(e).__name__, e)
+      sys.stdout.flush()
+    time.sleep(interval)
+
+def svg_file(document):
+  """A file object of document, a string of the bytes of an SVG document or
+  a file object already."""
+  if isinstance(document, unicode): document = document.encode('utf-8')
+  if isinstance(document, str): return cStringIO.StringIO(document)
+  return document
+
+def convert_level(document, opts=None, layer_cache=None):
+  """Convert document, the bytes of an SVG document or a file object,
+  returning the level as it is written out. Only the caches are read or
+  written. opts default to options()."""
+  opts = dict(opts or options())
+  level = parse_svg(svg_file(document), opts, layer_cache=layer_cache)
+  return finish_level(level, opts)
+
+def convert_svg(document, opts=None, layer_cache=None):
+  """convert_level written out in opts['format'], as a string."""
+  opts = opts or options()
+  return level_to_output(convert_level(document, opts, layer_cache), opts)
+
+def options(**overrides):
+  """Options for convert_level and convert_svg: those of the command line
+  by default, but without a cache, updated with overrides by key, e.g.
+  options(schema='game', scale=56.25) for --schema=game --width=56.25."""
+  opts = dict(options_from_args(make_parser().parse_args([])), cache=None)
+  unknown = set(overrides) - set(opts)
+  if unknown:
+    raise ValueError('Unknown options: ' + ', '.join(sorted(unknown)))
+  opts.update(overrides)
+  return check_options(opts)
+
+# Memory --serve keeps outputs in, apart from paths and layers.
+SERVE_OUTPUT_BYTES = 64 * 1024 * 1024
+# Seconds between evictions from the cache while serving.
+SERVE_EVICT_INTERVAL = 60
+
+def serve_request(request, opts, layer_cache, output_cache):
+  """Answer a --serve request: a dict with the SVG document as text under
+  'svg' or its file name under 'file', optionally 'options' by key which
+  replace those of the server, as in options(), and an 'id' copied to the
+  response. The response holds the output under 'output', base64 encoded
+  for --format=binary, or the failure under 'error', and what was printed
+  while converting as a list of lines under 'messages', which are cached
+  with the output. Outputs are cached in output_cache, paths in
+  opts['cache']."""
+  start = time.time()
+  response = {'id': request.get('id')}
+  messages = cStringIO.StringIO()
+  stdout, sys.stdout = sys.stdout, messages
+  try:
+    overrides = request.get('options') or {}
+    unknown = set(overrides) - set(CONVERSION_OPTIONS + OUTPUT_OPTIONS)
+    if unknown:
+      raise ValueError('Unknown options: ' + ', '.join(sorted(unknown)))
+    opts = check_options(dict(opts, **overrides))
+    if 'file' in request:
+      with open(request['file'], 'rb') as f: data = f.read()
+    else:
+      data = request['svg']
+      if isinstance(data, unicode): data = data.encode('utf-8')
+
+    key = document_key(data, opts)
+    output = output_cache.get(key)
+    printed = output_cache.get(messages_key(key))
+    response['cached'] = output is not None and printed is not None
+    if response['cached']:
+      sys.stdout.write(printed)
+    else:
+      recorder = Recorder(sys.stdout)
+      sys.stdout = recorder
+      try:
+        output = convert_svg(data, opts, layer_cache)
+      finally:
+        sys.stdout = recorder.out
+      output_cache.put(key, output)
+      output_cache.put(messages_key(key), recorder.getvalue())
+    if opts['format'] == 'binary': output = base64.b64encode(output)
+    response['output'] = output
+  except Exception as e:
+    response['error'] = '%s: %s' % (type(e).__name__, e)
+  finally:
+    sys.stdout = stdout
+  response['messages'] = messages.getvalue().splitlines()
+  response['seconds'] = time.time() - start
+  return response
+
+def serve(opts, socket_path=None):
+  """Answer --serve requests, JSON objects one per line, on stdin or on
+  connections to a Unix socket at socket_path, until the input ends. Paths,
+  layers and outputs are kept in memory between requests, so that only
+  what a request changes is converted again."""
+  layer_cache = cache.MemoryCache(max_entries=1024)
+  output_cache = cache.MemoryCache(opts['cache'], max_bytes=SERVE_OUTPUT_BYTES)
+  opts = dict(opts, cache=cache.MemoryCache(opts['cache']), profile=None)
+  evicted = [time.time()]
+
+  def answer(line, out):
+    try:
+      request = json.loads(line)
+      if not isinstance(request, dict): raise ValueError('Not an object')
+    except ValueError as e:
+      response = {'id': None, 'error': 'ValueError: %s' % e}
+    else:
+      response = serve_request(request, opts, layer_cache, output_cache)
+    out.write(json.dumps(response, sort_keys=True) + '\n')
+    out.flush()
+    # The server may run for days, so the cache on disk is kept to its size
+    # as it goes rather than only when it stops.
+    if time.time() - evicted[0] > SERVE_EVICT_INTERVAL:
+      opts['cache'].evict()
+      evicted[0] = time.time()
+
+  class Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+      for line in iter(self.rfile.readline, ''):
+        if line.strip(): answer(line, self.wfile)
+
+  try:
+    if not socket_path:
+      # stdout may have been redirected so that stray prints can't get mixed
+      # up with the responses.
+      for line in iter(sys.stdin.readline, ''):
+        if line.strip(): answer(line, sys.__stdout__)
+      return
+
+    if os.path.exists(socket_path) and \
+        stat.S_ISSOCK(os.stat(socket_path).st_mode):
+      os.remove(socket_path)
+    server = SocketServer.UnixStreamServer(socket_path, Handler)
+    try:
+      server.serve_forever()
+    finally:
+      server.server_close()
+      os.remove(socket_path)
+  finally:
+    opts['cache'].evict()
+
+def make_parser():
   parser = argparse.ArgumentParser(description='')
-  parser.add_argument('filename', metavar='FILE', type=str, nargs=1,
-      help='SVG file to convert')
+  parser.add_argument('filenames', metavar='FILE', type=str, nargs='*',
+      help='SVG files to convert; directories and glob patterns are '
+           'expanded to the SVG files they contain.')
+
+  parser.add_argument('-o', '--output', type=str, default=None,
+      help='Output file name, where {name} is replaced with the input file '
+           'name without extension, which it must contain for several '
+           'inputs. Defaults to path.lua for a single input and {name}.lua '
+           'otherwise, or .bin instead of .lua for --format=binary.')
+
+  parser.add_argument('--format', choices=['lua', 'binary'], default='lua',
+      help='Write the level as a Lua script, or in the packed binary format '
+           'read by loadLevelFile in src/LevelFile.lua.')
+
+  parser.add_argument('--schema', choices=['layers', 'game'],
+      default='layers',
+      help='Write every layer as a list of polygons and circles, or exactly '
+           'the definition src/Level.lua loads, baked into world coordinates '
+           'so that the game uses it without converting any vertices.')
+
+  parser.add_argument('--use', choices=['expand', 'table'], default='expand',
+      help='Write clones, i.e. use elements, as copies of the shape they '
+           'refer to, or as {use = id, transform = matrix} instances of '
+           'the shapes written once under the ' + PROTOTYPES_KEY + ' key. '
+           'Shapes are flattened once either way, as are paths which only '
+           'differ by a translation.')
+
+  parser.add_argument('--output-dir', type=str, default='.',
+      help='Directory in which to write the output files.')
+
+  parser.add_argument('-j', '--jobs', type=int, default=1,
+      help='Number of worker processes. Files are converted in parallel, or '
+           'the layers of a single file if only one is given.')
+
+  parser.add_argument('--watch', action='store_true',
+      help='Keep running and reconvert the files whenever they are saved.')
+
+  parser.add_argument('--poll-interval', type=float, default=0.05,
+      help='Seconds between checks for changed files in --watch mode.')
+
+  parser.add_argument('--serve', action='store_true',
+      help='Keep running and convert documents sent as JSON lines on stdin, '
+           'answering each with a JSON line on stdout, instead of files. '
+           'The other options are the defaults of every request. Paths, '
+           'layers and documents stay cached in memory between requests.')
+
+  parser.add_argument('--socket', type=str, default=None,
+      help='Serve as --serve does, but on connections to a Unix socket at '
+           'this path, one connection at a time.')
+
+  parser.add_argument('--cache-dir', type=str,
+      default=os.path.join(os.path.expanduser('~'), '.cache', 'svg_to_level'),
+      help='Directory of the cache of converted files and paths.')
+
+  parser.add_argument('--cache-size', type=float, default=256,
+      help='Size in megabytes above which the least recently used cache '
+           'entries are evicted.')
+
+  parser.add_argument('--no-cache', action='store_true',
+      help='Neither read nor write the cache.')
+
+  parser.add_argument('--compact', action='store_true',
+      help='Write lists of coordinates on a single line in Lua output.')
+
+  parser.add_argument('--precision', type=int, default=None,
+      help='Number of decimal places to which coordinates are rounded in Lua '
+           'output. By default they are written in full.')
+
+  parser.add_argument('--index', choices=['none', 'grid', 'quadtree'],
+      default='none',
+      help='Add the bounds of every object and, under the _index key, a '
+           'uniform grid or a quadtree of the objects, so the game can load '
+           'only those near the camera.')
+
+  parser.add_argument('--cell-size', type=float, default=25.0,
+      help='Size in world units of the grid cells, of the smallest quadtree '
+           'nodes and of the --occluders cells.')
+
+  parser.add_argument('--split-long', action='store_true',
+      help='With --index, split polygons which span several cells into open '
+           'chains at the cell boundaries. Split polygons are not filled by '
+           '--triangulate.')
+
+  parser.add_argument('--triangulate', action='store_true',
+      help='Add to every polygon the index buffer of its triangles, under '
+           'the triangles key, or under CollisionTriangles for the game '
+           'schema, so that the game can fill it without triangulating. '
+           'Triangles are counter-clockwise, except in the world through an '
+           'instance marked reflected, or an odd number of them, for which '
+           'their vertices are to be taken in reverse.')
+
+  parser.add_argument('--occluders', action='store_true',
+      help='Add the outward facing edges of the ' + OCCLUDER_LAYER + ' '
+           'layer, bucketed by --cell-size grid cells, under the _occluders '
+           'key, or Occluders for the game schema, so that lights can cast '
+           'shadows from the edges near them.')
+
+  parser.add_argument('--profile', action='store_true',
+      help='Report the time spent in each stage of the conversion and the '
+           'slowest elements. Conversions run in a single process.')
+
+  parser.add_argument('--profile-top', type=int, default=10,
+      help='Number of slowest elements listed by --profile.')
+
+  parser.add_argument('--profile-output', type=str, default=None,
+      help='Run the conversions under cProfile and save the statistics to '
+           'this file, for use with the pstats module.')
 
   parser.add_argument('--refinement', type=float, default=18,
-      help='Pixel distance between two consecutive points on a curve.')
+      help='Distance between two consecutive points on a curve, in --units '
+           'once the path is transformed into place.')
+
+  parser.add_argument('--flatten', choices=['uniform', 'resample', 'adaptive'],
+      default='uniform',
+      help='How curves are turned into polygons: about every --refinement '
+           'pixels evenly spaced in the curve parameter, at most every '
+           '--refinement pixels evenly spaced along the curve, or subdivided '
+           'until within --tolerance.')
+
+  parser.add_argument('--tolerance', type=float, default=1.0,
+      help='Maximum distance in --units between a curve and its polygon '
+           'when using --flatten=adaptive.')
+
+  parser.add_argument('--units', choices=['px', 'world'], default='px',
+      help='Units of --refinement and --tolerance: pixels of the document, '
+           'or world units as set by --width.')
+
+  parser.add_argument('--simplify', choices=['none', 'rdp', 'visvalingam'],
+      default='none',
+      help='Polygon simplification applied to paths after flattening: '
+           'Ramer-Douglas-Peucker or Visvalingam-Whyatt.')
+
+  parser.add_argument('--simplify-tolerance', type=float, default=0.5,
+      help='Pixel distance (rdp) or square root of the triangle area '
+           '(visvalingam) below which vertices are dropped.')
+
+  parser.add_argument('--min-edge', type=float, default=0.005,
+      help='Shortest edge, in world units, allowed in a simplified or '
+           'validated polygon. Defaults to Box2D\'s linear slop.')
+
+  parser.add_argument('--validate', choices=['none', 'report', 'repair'],
+      default='report',
+      help='Check path polygons for duplicate vertices, edges no longer '
+           'than --min-edge, turns straight back and self-intersections, '
+           'which Box2D chains do not handle. Report them, or also repair '
+           'them by merging close vertices and splitting polygons where '
+           'their edges cross.')
 
   parser.add_argument('--width', type=float, default=100.0,
       help='The width of the screen to which to scale the world coordinates.')
 
-  args = parser.parse_args()
-  opts = {
-      'filename': args.filename[0],
+  parser.add_argument('--height', type=float, default=None,
+      help='The height of the screen in world units, to place the bottom of '
+           'the document at the bottom of the screen as the game does, e.g. '
+           '56.25 for the game\'s 16:9 screen. By default the document is '
+           'centred vertically.')
+
+  return parser
+
+def options_from_args(args):
+  """The options of a conversion given the parsed command line, other than
+  the output file name."""
+  return check_options({
+      'output_dir': args.output_dir,
+      'format': args.format,
+      'compact': args.compact,
+      'precision': args.precision,
+      'index': args.index,
+      'cell_size': args.cell_size,
+      'split_long': args.split_long,
+      'triangulate': args.triangulate,
+      'occluders': args.occluders,
+      'profile': profiling.Profile() if args.profile else None,
+      'cache': None if args.no_cache else cache.Cache(
+          args.cache_dir, int(args.cache_size * 1024 * 1024)),
       'refinement': args.refinement,
-      'scale': args.width
-  }
+      'flatten': args.flatten,
+      'tolerance': args.tolerance,
+      'simplify': args.simplify,
+      'simplify_tolerance': args.simplify_tolerance,
+      'min_edge': args.min_edge,
+      'scale': args.width,
+      'height': args.height,
+      'units': args.units,
+      'schema': args.schema,
+      'validate': args.validate,
+      'use': args.use
+  })
+
+def check_options(opts):
+  """Drop the options which the schema has no use for, with a warning."""
+  if opts['schema'] == 'game' and opts['index'] != 'none':
+    print 'W: The game schema has no index, ignoring --index.'
+    opts['index'] = 'none'
+  if opts['schema'] == 'game' and opts['use'] != 'expand':
+    print 'W: The game schema has no instances, expanding clones.'
+    opts['use'] = 'expand'
+  return opts
+
+if __name__ == '__main__':
+  parser = make_parser()
+  args = parser.parse_args()
+  # Serving on stdin, the responses go to stdout and everything else to
+  # stderr.
+  if args.serve and not args.socket: sys.stdout = sys.stderr
+  opts = options_from_args(args)
+  if args.serve or args.socket:
+    try:
+      serve(opts, args.socket)
+    except KeyboardInterrupt:
+      pass
+    sys.exit(0)
+
+  if not args.filenames: parser.error('no files to convert')
+  filenames = find_inputs(args.filenames)
+  extension = '.bin' if args.format == 'binary' else '.lua'
+  opts['output'] = args.output or (('path' if len(filenames) == 1
+                                    else '{name}') + extension)
+  # Inputs written to the same file would silently replace each other.
+  if len(filenames) > 1 and '{name}' not in opts['output']:
+    parser.error('-o must contain {name} to convert several files')
+  outputs = collections.Counter(output_filename(f, opts) for f in filenames)
+  clashes = sorted(output for output, n in outputs.iteritems() if n > 1)
+  if clashes:
+    parser.error('several files would be written to ' + ', '.join(clashes))
+
+  if args.watch:
+    try:
+      watch(filenames, opts, args.poll_interval, args.profile_top)
+    except KeyboardInterrupt:
+      sys.exit(0)
+
+  profiler = cProfile.Profile() if args.profile_output else None
+  if (args.profile or profiler) and args.jobs > 1:
+    print 'W: Profiling runs conversions in a single process, ignoring -j.'
+    args.jobs = 1
+  if profiler: profiler.enable()
+
+  pool = multiprocessing.Pool(args.jobs) if args.jobs > 1 else None
+  if pool and len(filenames) == 1:
+    results = [convert_job((filenames[0], opts, pool))]
+  elif pool:
+    results = pool.imap_unordered(convert_job, [(f, opts) for f in filenames])
+  else:
+    results = itertools.imap(convert_job, [(f, opts) for f in filenames])
+
+  failed = 0
+  for filename, output, cached, seconds, error in results:
+    if error:
+      failed += 1
+      print 'E: %s: %s' % (filename, error)
+    else:
+      print '%s -> %s (%.3f s%s)' % (
+          filename, output, seconds, ', cached' if cached else '')
+
+  if pool:
+    pool.close()
+    pool.join()
+  if profiler:
+    profiler.disable()
+    profiler.dump_stats(args.profile_output)
+  if opts['profile']:
+    print
+    opts['profile'].report(sys.stdout, args.profile_top)
+  if opts['cache']: opts['cache'].evict()
 
-  with open('path.lua', 'w') as f:
-    f.write(level_to_lua(parse_svg(opts['filename'], opts)))
-    f.write('\n')
+  sys.exit(1 if failed else 0)
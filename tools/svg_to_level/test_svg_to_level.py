@@ -0,0 +1,186 @@
+"""Regression tests for svg_to_level, run with python -m unittest discover
+from this directory."""
+
+import cache
+import cStringIO
+import multiprocessing
+import os
+import shutil
+import spatial
+import sys
+import tempfile
+import unittest
+
+import svg_to_level
+
+SVG = '''<svg xmlns="http://www.w3.org/2000/svg"
+    xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+    xmlns:xlink="http://www.w3.org/1999/xlink" width="100" height="100">
+  <g inkscape:label="Collisions" inkscape:groupmode="layer">%s</g>
+</svg>'''
+
+ROCK = '<path id="rock" d="M 0,0 L 10,0 L 0,10 Z"/>'
+
+def corners(level, name='collisions'):
+  """The first point of each object of a layer."""
+  return [tuple(obj['poly'][:2]) for obj in level[name]]
+
+class ConvertTest(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.pool = multiprocessing.Pool(2)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.pool.close()
+    cls.pool.join()
+
+  def convert(self, body, **overrides):
+    """Convert an SVG document with body as its only layer in each mode
+    parse_svg has: streaming, with -j and with a layer cache. Checks the
+    modes agree and returns the level and what was printed."""
+    document = SVG % body
+    opts = svg_to_level.options(**overrides)
+    stdout, sys.stdout = sys.stdout, cStringIO.StringIO()
+    try:
+      levels = [
+          svg_to_level.parse_svg(cStringIO.StringIO(document), dict(opts)),
+          svg_to_level.parse_svg(cStringIO.StringIO(document), dict(opts),
+                                 self.pool),
+          svg_to_level.parse_svg(cStringIO.StringIO(document), dict(opts),
+                                 layer_cache=cache.MemoryCache())]
+      printed = sys.stdout.getvalue()
+    finally:
+      sys.stdout = stdout
+    for level in levels[1:]: self.assertEqual(levels[0], level)
+    return levels[0], printed
+
+  def test_clone_of_clone(self):
+    level, printed = self.convert(
+        ROCK + '<use id="c1" xlink:href="#rock" x="20"/>'
+               '<use id="c2" xlink:href="#c1" x="40"/>')
+    self.assertEqual(corners(level),
+                     [(-50.0, 50.0), (-30.0, 50.0), (10.0, 50.0)])
+    self.assertEqual(printed, '')
+
+  def test_clone_of_later_clone(self):
+    level, _ = self.convert(
+        '<use id="c2" xlink:href="#c1" x="40"/>'
+        '<use id="c1" xlink:href="#rock" x="20"/>' + ROCK)
+    self.assertEqual(corners(level),
+                     [(10.0, 50.0), (-30.0, 50.0), (-50.0, 50.0)])
+
+  def test_forward_clones_keep_their_place(self):
+    level, _ = self.convert(
+        ROCK + '<g><use xlink:href="#coral" x="20"/>'
+               '<use xlink:href="#rock" x="40"/></g>'
+               '<use xlink:href="#coral" x="60"/>'
+               '<path id="coral" d="M 0,20 L 10,20 L 0,30 Z"/>')
+    self.assertEqual(corners(level), [(-50.0, 50.0), (-30.0, 30.0),
+                                      (-10.0, 50.0), (10.0, 30.0),
+                                      (-50.0, 30.0)])
+
+  def test_clone_of_itself(self):
+    level, printed = self.convert(
+        ROCK + '<g id="loop"><use id="self" xlink:href="#loop"/></g>'
+               '<use id="c1" xlink:href="#c2"/>'
+               '<use id="c2" xlink:href="#c1"/>')
+    self.assertEqual(corners(level), [(-50.0, 50.0)])
+    self.assertIn('W: Clone self refers to #loop, which contains it.',
+                  printed)
+    self.assertIn('W: Clone c1 refers to #c2, which contains it.', printed)
+
+  def test_shared_path_data(self):
+    # The prototype's data is the attribute's value, not its raw text.
+    path = '<path d="M 0,0&#10;L 10,0 L 0,10 Z"/>'
+    level, _ = self.convert(path + path, use='table')
+    id, = level[svg_to_level.PROTOTYPES_KEY]
+    self.assertEqual(corners(level[svg_to_level.PROTOTYPES_KEY], id),
+                     [(-50.0, 50.0)])
+    self.assertEqual([obj['use'] for obj in level['collisions']], [id, id])
+
+  def test_table_instances(self):
+    level, printed = self.convert(
+        ROCK + '<use xlink:href="#rock" x="20"/>'
+               '<use id="c1" xlink:href="#nothere"/>'
+               '<g id="loop"><use xlink:href="#loop"/></g>', use='table')
+    self.assertEqual([obj.get('use') for obj in level['collisions']],
+                     [None, 'rock'])
+    self.assertEqual(sorted(level[svg_to_level.PROTOTYPES_KEY]), ['rock'])
+    self.assertIn('W: Clones refer to #loop, which contains them.', printed)
+    indexed = spatial.index_level(level, 'grid', 25.0)
+    self.assertEqual(indexed['collisions'][1]['bounds'],
+                     [-30.0, 40.0, -20.0, 50.0])
+    self.assertEqual(indexed['_index']['cells']['-1,1'], {'collisions': [2]})
+
+  def test_path_cache_across_widths(self):
+    # The same path in world units, flattened at spacings twice as far apart
+    # in the wider document.
+    path = '<path d="M 0,0 C 0,100 100,100 100,0 Z"/>'
+    documents = [(SVG % path).replace('width="100"', 'width="200"'),
+                 SVG % ('<g transform="scale(0.5)">%s</g>' % path)]
+    shared = cache.MemoryCache()
+    for document in documents:
+      uncached = svg_to_level.convert_level(document)
+      cached = svg_to_level.convert_level(
+          document, svg_to_level.options(cache=shared))
+      self.assertEqual(cached, uncached)
+
+  def test_cached_file_warnings(self):
+    directory = tempfile.mkdtemp()
+    try:
+      filename = os.path.join(directory, 'level.svg')
+      with open(filename, 'w') as f:
+        f.write(SVG % '<g id="loop"><use id="self" xlink:href="#loop"/></g>')
+      opts = dict(svg_to_level.options(cache=cache.MemoryCache(),
+                                       output_dir=directory),
+                  output='{name}.lua')
+      for cached in (False, True):
+        stdout, sys.stdout = sys.stdout, cStringIO.StringIO()
+        try:
+          result = svg_to_level.convert_file(filename, opts)
+          printed = sys.stdout.getvalue()
+        finally:
+          sys.stdout = stdout
+        self.assertEqual(result[1], cached)
+        self.assertEqual(printed,
+                         'W: Clone self refers to #loop, which contains it.\n')
+    finally:
+      shutil.rmtree(directory)
+
+  def test_cached_request_warnings(self):
+    opts = svg_to_level.options(cache=cache.MemoryCache())
+    request = {'svg': SVG % '<g id="loop"><use xlink:href="#loop"/></g>'}
+    output_cache = cache.MemoryCache()
+    responses = [svg_to_level.serve_request(request, opts, cache.MemoryCache(),
+                                            output_cache) for _ in xrange(2)]
+    self.assertEqual([response['cached'] for response in responses],
+                     [False, True])
+    self.assertEqual(responses[0]['messages'], responses[1]['messages'])
+    self.assertEqual(len(responses[1]['messages']), 1)
+
+  def test_transformed_circles(self):
+    circle = ('<g transform="%s"><path id="c" sodipodi:type="arc" '
+              'sodipodi:cx="10" sodipodi:cy="20" sodipodi:rx="10" '
+              'sodipodi:ry="10" d="M 0,0"/></g>')
+    for transform in ('rotate(90)', 'rotate(180)', 'scale(-1,1)',
+                      'rotate(30) scale(2)'):
+      level = svg_to_level.convert_level(
+          (SVG % (circle % transform)).replace(
+              '<svg ', '<svg xmlns:sodipodi="%s" ' %
+              svg_to_level.SODIPODI_URI[1:-1]))
+      (obj,) = level['collisions']
+      self.assertAlmostEqual(obj['circle'][2],
+                             20.0 if 'scale(2)' in transform else 10.0)
+
+  def test_reflected_instances(self):
+    level = svg_to_level.convert_level(
+        SVG % (ROCK + '<use xlink:href="#rock" transform="scale(-1,1)"/>'
+                      '<use xlink:href="#rock" x="20"/>'),
+        svg_to_level.options(use='table', triangulate=True))
+    self.assertEqual([obj.get('reflected') for obj in level['collisions']],
+                     [None, True, None])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,52 @@
+"""Tests for validation, run with python -m unittest discover from this
+directory."""
+
+import random
+import unittest
+
+import validation
+
+def crossings_brute_force(points):
+  """crossings by testing all pairs of edges."""
+  edges = len(points) - 1
+  closed = validation._closed(points)
+  result = []
+  for i in xrange(edges):
+    for j in xrange(i + 1, edges):
+      if validation._adjacent(i, j, edges, closed): continue
+      p = validation.segment_intersection(points[i], points[i + 1],
+                                          points[j], points[j + 1])
+      if p is not None: result.append((i, j, p))
+  return result
+
+class CrossingsTest(unittest.TestCase):
+
+  def check(self, points):
+    self.assertEqual(validation.crossings(points),
+                     crossings_brute_force(points))
+
+  def test_figure_eight(self):
+    points = [0j, 10 + 10j, 10 + 0j, 0 + 10j, 0j]
+    self.assertEqual(validation.crossings(points), [(0, 2, 5 + 5j)])
+    self.check(points)
+
+  def test_touching_and_collinear(self):
+    # A vertex on another edge and an edge doubling back along another.
+    self.check([0j, 10 + 0j, 10 + 10j, 5 + 0j, 5 - 5j, 0j])
+    self.check([0j, 10 + 0j, 5 + 0j, 5 + 5j, 0j])
+
+  def test_open_chain(self):
+    # The ends of an open chain meeting is a crossing.
+    self.check([0j, 10 + 0j, 10 + 10j, 0 + 10j, 0j, 5 + 0j])
+
+  def test_random_chains(self):
+    rng = random.Random(14)
+    for _ in xrange(200):
+      # Integer coordinates make for many touching and collinear edges.
+      points = [complex(rng.randint(0, 20), rng.randint(0, 20))
+                for _ in xrange(rng.randint(2, 30))]
+      if rng.random() < .5: points.append(points[0])
+      self.check(points)
+
+if __name__ == '__main__':
+  unittest.main()
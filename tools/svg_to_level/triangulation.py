@@ -0,0 +1,138 @@
+"""Ear clipping triangulation of level polygons, for filling them.
+
+Points are complex numbers in world units. Polygons are rings: a repeated
+closing point is ignored, and an open polygon is closed by its last edge as
+addChain closes chains. Triangles are returned as a flat index buffer of
+1-based vertex numbers, [i1, j1, k1, i2, j2, k2, ...], as Lua numbers them,
+each triangle counter-clockwise with y pointing up in the frame of the
+points.
+"""
+
+import math
+
+def _cross(u, v):
+  return u.real * v.imag - u.imag * v.real
+
+def signed_area(points):
+  """Twice the area of the ring, positive if it is counter-clockwise."""
+  return sum(_cross(a, b) for a, b in zip(points, points[1:] + points[:1]))
+
+def _ring(points):
+  """The vertex numbers and points of the ring, without repeated points."""
+  if len(points) > 1 and points[0] == points[-1]: points = points[:-1]
+  ring = [(i, p) for i, p in enumerate(points, 1)
+          if i == 1 or p != points[i - 2]]
+  while len(ring) > 1 and ring[-1][1] == ring[0][1]: ring.pop()
+  return ring
+
+def _inside(p, a, b, c):
+  """Whether p is inside or on the counter-clockwise triangle abc."""
+  x, y = p.real, p.imag
+  ax, ay, bx, by, cx, cy = a.real, a.imag, b.real, b.imag, c.real, c.imag
+  return (bx - ax) * (y - ay) >= (by - ay) * (x - ax) and \
+         (cx - bx) * (y - by) >= (cy - by) * (x - bx) and \
+         (ax - cx) * (y - cy) >= (ay - cy) * (x - cx)
+
+class _ReflexGrid(object):
+  """The reflex vertices of a ring bucketed in a uniform grid, so that ear
+  tests only look at those near the ear rather than all of them."""
+
+  def __init__(self, points, reflex):
+    xs, ys = [p.real for p in points], [p.imag for p in points]
+    self.x0, self.y0 = min(xs), min(ys)
+    width, height = max(xs) - self.x0, max(ys) - self.y0
+    # About one vertex per cell.
+    self.size = math.sqrt(width * height / len(points)) or \
+                max(width, height) / len(points) or 1.0
+    self.points, self.reflex = points, reflex
+    self.cells = {}
+    for i in reflex:
+      self.cells.setdefault(self._cell(points[i]), []).append(i)
+
+  def _cell(self, p):
+    return (int((p.real - self.x0) / self.size),
+            int((p.imag - self.y0) / self.size))
+
+  def candidates(self, a, b, c):
+    """Reflex vertices which may lie in the triangle abc."""
+    i0, j0 = self._cell(complex(min(a.real, b.real, c.real),
+                                min(a.imag, b.imag, c.imag)))
+    i1, j1 = self._cell(complex(max(a.real, b.real, c.real),
+                                max(a.imag, b.imag, c.imag)))
+    if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.reflex): return self.reflex
+    # Vertices which stopped being reflex are left in their cells.
+    return [k for i in xrange(i0, i1 + 1) for j in xrange(j0, j1 + 1)
+            for k in self.cells.get((i, j), ())]
+
+def triangulate(points):
+  """Triangulate a simple polygon by ear clipping. Returns the index buffer
+  and whether an ear had to be forced, which only happens if the polygon is
+  not simple, and then the triangles may overlap. Not every polygon which
+  is not simple needs one: look for crossing edges to tell."""
+  ring = _ring(points)
+  if len(ring) < 3: return [], False
+  if signed_area([p for _, p in ring]) < 0: ring.reverse()
+  numbers = [i for i, _ in ring]
+  points = [p for _, p in ring]
+
+  n = len(points)
+  prev = range(-1, n - 1)
+  prev[0] = n - 1
+  next = range(1, n + 1)
+  next[-1] = 0
+
+  def turn(i):
+    return _cross(points[i] - points[prev[i]], points[next[i]] - points[i])
+
+  # Collinear vertices count as reflex, so that no ear has one on its edge.
+  reflex = set(i for i in xrange(n) if turn(i) <= 0)
+  grid = _ReflexGrid(points, reflex)
+
+  def is_ear(i):
+    if i in reflex: return False
+    before, after = prev[i], next[i]
+    a, b, c = points[before], points[i], points[after]
+    min_x, max_x = min(a.real, b.real, c.real), max(a.real, b.real, c.real)
+    min_y, max_y = min(a.imag, b.imag, c.imag), max(a.imag, b.imag, c.imag)
+    for k in grid.candidates(a, b, c):
+      if k == before or k == after or k not in reflex: continue
+      p = points[k]
+      if min_x <= p.real <= max_x and min_y <= p.imag <= max_y and \
+          p != a and p != c and _inside(p, a, b, c):
+        return False
+    return True
+
+  triangles, forced = [], False
+  i, remaining, tried = 0, n, 0
+  while remaining > 3:
+    if tried == remaining:
+      # A full turn without an ear: drop a collinear vertex, or failing that
+      # the polygon is not simple and an ear is forced, at a convex vertex
+      # if there is one left.
+      collinear = [k for k in reflex if turn(k) == 0]
+      if collinear:
+        i = collinear[0]
+      else:
+        forced = True
+        for _ in xrange(remaining):
+          if i not in reflex: break
+          i = next[i]
+    elif not is_ear(i):
+      i = next[i]
+      tried += 1
+      continue
+
+    before, after = prev[i], next[i]
+    if turn(i) != 0: triangles.extend((before, i, after))
+    next[before], prev[after] = after, before
+    reflex.discard(i)
+    remaining -= 1
+    for k in (before, after):
+      if k in reflex and turn(k) > 0: reflex.discard(k)
+    # Carry on from the next vertex rather than going back to the previous
+    # one, which would fan out long ears from a single vertex.
+    i, tried = after, 0
+
+  i = next[i]
+  if turn(i) != 0: triangles.extend((prev[i], i, next[i]))
+  return [numbers[k] for k in triangles], forced
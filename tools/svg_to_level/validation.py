@@ -0,0 +1,152 @@
+"""Validation and repair of collision chains.
+
+Box2D chains misbehave on repeated vertices, on edges no longer than its
+linear slop and on edges which meet anywhere but at their shared vertex.
+Points are complex numbers in world units, and a closed chain repeats its
+first point at the end, as in geometry.py.
+"""
+
+import geometry
+import heapq
+
+def _cross(u, v):
+  return u.real * v.imag - u.imag * v.real
+
+def _dot(u, v):
+  return u.real * v.real + u.imag * v.imag
+
+def _within(p, a, b):
+  """Whether p, which is collinear with a and b, lies between them."""
+  return min(a.real, b.real) <= p.real <= max(a.real, b.real) and \
+         min(a.imag, b.imag) <= p.imag <= max(a.imag, b.imag)
+
+def segment_intersection(a, b, c, d):
+  """The point at which the segments ab and cd meet, or None. Segments which
+  touch or overlap meet at the touching point, or the end of the overlap
+  nearest a."""
+  d1, d2 = _cross(d - c, a - c), _cross(d - c, b - c)
+  d3, d4 = _cross(b - a, c - a), _cross(b - a, d - a)
+  if (d1 > 0 > d2 or d1 < 0 < d2) and (d3 > 0 > d4 or d3 < 0 < d4):
+    return a + (b - a) * (d1 / (d1 - d2))
+
+  touching = [p for p, o, s, e in ((a, d1, c, d), (b, d2, c, d),
+                                   (c, d3, a, b), (d, d4, a, b))
+              if o == 0 and _within(p, s, e)]
+  if not touching: return None
+  return min(touching, key=lambda p: abs(p - a))
+
+def _closed(points):
+  return len(points) > 3 and points[0] == points[-1]
+
+def _adjacent(i, j, edges, closed):
+  return abs(i - j) == 1 or (closed and abs(i - j) == edges - 1)
+
+def crossings(points):
+  """Where non-adjacent edges of the chain meet, as (i, j, point) with i < j
+  the indices of the edges' first points, sorted.
+
+  A sweep line moves along the chain's longer axis, keeping the edges which
+  span it. Each edge is only tested against those active edges whose extent
+  across the sweep overlaps its own, so chains of short edges such as
+  flattened curves take close to O(n log n) rather than the O(n^2) of
+  testing all pairs."""
+  edges = len(points) - 1
+  if edges < 2: return []
+  closed = _closed(points)
+
+  xs = [p.real for p in points]
+  ys = [p.imag for p in points]
+  if max(ys) - min(ys) > max(xs) - min(xs): xs, ys = ys, xs
+  starts = map(min, xs, xs[1:])
+  lows, highs = map(min, ys, ys[1:]), map(max, ys, ys[1:])
+  last = edges - 1 if closed else -1
+
+  active, ends = {}, []
+  result = []
+  for i in sorted(xrange(edges), key=starts.__getitem__):
+    start = starts[i]
+    while ends and ends[0][0] < start: del active[heapq.heappop(ends)[1]]
+
+    low, high = lows[i], highs[i]
+    for j, (other_low, other_high) in active.iteritems():
+      if other_high < low or other_low > high or j == i - 1 or j == i + 1 \
+          or (i == 0 and j == last) or (j == 0 and i == last):
+        continue
+      first, second = min(i, j), max(i, j)
+      p = segment_intersection(points[first], points[first + 1],
+                               points[second], points[second + 1])
+      if p is not None: result.append((first, second, p))
+
+    active[i] = (low, high)
+    heapq.heappush(ends, (max(xs[i], xs[i + 1]), i))
+
+  result.sort(key=lambda c: c[:2])
+  return result
+
+def remove_duplicates(points):
+  return [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+
+def spikes(points):
+  """Indices of the points at which the chain turns straight back."""
+  closed = _closed(points)
+  last = len(points) - 1
+  result = []
+  for i in xrange(0 if closed else 1, last):
+    before = points[i - 1 if i else last - 1]
+    u, v = points[i] - before, points[i + 1] - points[i]
+    if _cross(u, v) == 0 and _dot(u, v) < 0: result.append(i)
+  return result
+
+def validate(points, min_edge):
+  """The problems with a chain, as a list of (problem, points) pairs."""
+  duplicates, short = [], []
+  for a, b in zip(points, points[1:]):
+    if a == b: duplicates.append(a)
+    elif abs(b - a) <= min_edge: short.append(a)
+
+  points = remove_duplicates(points)
+  problems = [('duplicate vertices', duplicates), ('short edges', short),
+              ('spikes', [points[i] for i in spikes(points)]),
+              ('crossings', [p for _, _, p in crossings(points)])]
+  return [(problem, at) for problem, at in problems if at]
+
+def _drop_spikes(points):
+  while True:
+    turns = set(spikes(points))
+    if not turns: return points
+    closed = _closed(points)
+    if closed: points = points[:-1]
+    points = remove_duplicates(
+        [p for i, p in enumerate(points) if i not in turns])
+    if closed and points: points.append(points[0])
+
+def _clean(points, min_edge):
+  points = geometry.remove_short_edges(remove_duplicates(points), min_edge)
+  return _drop_spikes(points)
+
+def _usable(points, min_edge):
+  if points[0] == points[-1]: return len(points) > 3
+  return len(points) > 2 or abs(points[-1] - points[0]) > min_edge
+
+def repair(points, min_edge):
+  """Pieces of the chain with its problems repaired. Vertices closer than
+  min_edge are merged, turns straight back dropped and wherever two edges
+  meet the loop between them is split off as a separate closed chain.
+  Pieces which collapse to nothing are dropped."""
+  pending, pieces = [_clean(points, min_edge)], []
+  # Every split removes a crossing, this only guards against degenerate input.
+  splits = len(points)
+  while pending:
+    points = pending.pop()
+    if not points or not _usable(points, min_edge): continue
+    found = crossings(points) if splits > 0 else []
+    if not found:
+      pieces.append(points)
+      continue
+
+    splits -= 1
+    i, j, p = found[0]
+    outer = points[:i + 1] + [p] + points[j + 1:]
+    loop = [p] + points[i + 1:j + 1] + [p]
+    pending.extend(_clean(piece, min_edge) for piece in (loop, outer))
+  return pieces